@@ -0,0 +1,61 @@
+from SRC import correlation
+
+def new_context(df):
+    """
+    A per-run memo of what the analysis stages derive from one cleaned frame:
+    group indices, per-group moments, risk tables and co-moment accumulators.
+    Each is computed on first use and then shared by every stage that receives
+    the context. Replacing the frame or changing its shape or columns clears
+    the memo automatically; after editing values in place, call invalidate().
+    """
+    return {'df': df, 'token': _frame_token(df), 'cache': {}, 'hits': 0, 'misses': 0}
+
+def memoize(context, key, compute, df=None):
+    """
+    Returns the value stored under key, computing and storing it on first use.
+    Without a context (or when df is not the context's frame) the value is
+    simply computed, so callers can take an optional context.
+    """
+    if context is None or (df is not None and df is not context['df']):
+        return compute()
+    if _frame_token(context['df']) != context['token']:
+        invalidate(context)
+    cache = context['cache']
+    if key in cache:
+        context['hits'] += 1
+        return cache[key]
+    context['misses'] += 1
+    cache[key] = value = compute()
+    return value
+
+def invalidate(context, df=None):
+    """Drops every memoized value, optionally switching the context to a new frame."""
+    if df is not None:
+        context['df'] = df
+    context['token'] = _frame_token(context['df'])
+    context['cache'].clear()
+
+def group_indices(context, group_col, df=None):
+    """Row positions of every group as {group: positions}, e.g. the STEM / Non-STEM split."""
+    frame = df if df is not None else context['df']
+    return memoize(context, ('indices', group_col),
+                   lambda: frame.groupby(group_col, observed=True, sort=True).indices, frame)
+
+def comoments(context, variables, df=None, listwise=False):
+    """
+    A co-moment accumulator covering the variables (see the correlation module).
+    A pairwise one already built for a superset of them is reused (listwise
+    accumulators depend on the exact variable set, so those are not).
+    """
+    frame = df if df is not None else context['df']
+    if not listwise and context is not None and frame is context['df'] and _frame_token(frame) == context['token']:
+        for key, acc in context['cache'].items():
+            if key[0] == 'comoments' and not key[2] and set(variables) <= set(key[1]):
+                context['hits'] += 1
+                return acc
+    return memoize(context, ('comoments', tuple(variables), listwise),
+                   lambda: correlation.accumulate(frame, variables, listwise=listwise), frame)
+
+def _frame_token(df):
+    """Cheap identity of a frame: replacing it or changing its shape or columns changes the token."""
+    return None if df is None else (id(df), df.shape, tuple(df.columns))
@@ -0,0 +1,188 @@
+import argparse
+import gc
+import json
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+from SRC import data_cleaning
+from SRC import predictive_modeling
+from SRC import stats_analysis
+from SRC import synthetic
+
+BENCHMARK_SIZES = [10_000, 1_000_000, 10_000_000]
+BENCHMARK_DIR = "reports/benchmarks"
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baseline.json")
+# A stage regresses when it is this much slower (or hungrier) than its baseline
+REGRESSION_TOLERANCE = 0.25
+# ...and by at least this many seconds, so timer noise on tiny stages is not flagged
+MIN_REGRESSION_SECONDS = 0.05
+WARMUP_ROWS = 1_000
+METRICS = ['Stress_Level', 'Depression_Score', 'Anxiety_Score']
+
+def benchmark_stages(metrics=METRICS):
+    """
+    The timed stages: name -> function(raw, clean, logger). Each stage gets the
+    raw synthetic survey and its cleaned version; plotting and EFA libraries are
+    imported only when their stage runs.
+    """
+    def risk_targets(raw, clean, logger):
+        for col, label in predictive_modeling.RISK_TARGETS.items():
+            predictive_modeling._calculate_target_risk(clean, col, label)
+
+    def efa(raw, clean, logger):
+        from SRC import unsupervised
+        unsupervised.perform_efa(clean, metrics, logger)
+
+    def bar_charts(raw, clean, logger):
+        from SRC import visualization
+        visualization.run_all_visualizations(clean, logger, metrics, max_workers=1)
+
+    def heatmap(raw, clean, logger):
+        from SRC import visualization
+        visualization.plot_correlation_heatmap(clean, metrics, logger)
+
+    return {
+        'pre_process': lambda raw, clean, logger: data_cleaning.pre_process(raw, output_path=None),
+        'run_t_tests': lambda raw, clean, logger: stats_analysis.run_t_tests(clean, metrics, logger),
+        'run_anova_and_tukey': lambda raw, clean, logger: stats_analysis.run_anova_and_tukey(clean, metrics, logger),
+        'calculate_target_risk': risk_targets,
+        'perform_efa': efa,
+        'run_all_visualizations': bar_charts,
+        'plot_correlation_heatmap': heatmap,
+    }
+
+def run_benchmarks(sizes=BENCHMARK_SIZES, stages=None, baseline_path=BASELINE_PATH, tolerance=REGRESSION_TOLERANCE,
+                   repeats=1, n_courses=len(synthetic.COURSES), missing_rates=synthetic.MISSING_RATES, seed=0,
+                   logger=None):
+    """
+    Times and memory-profiles every stage on synthetic surveys of each size.
+    Wall time is the best of `repeats` untraced runs; peak memory comes from
+    one extra run under tracemalloc. Results are compared with the stored
+    baseline and flagged as regressions beyond the tolerance.
+    Returns one row per (stage, size).
+    """
+    logger = logger or logging.getLogger(__name__)
+    selected = {name: fn for name, fn in benchmark_stages().items() if stages is None or name in stages}
+    baseline = load_baseline(baseline_path)
+    rows = []
+
+    # Stages write their reports to relative paths, so they run inside a scratch folder
+    previous_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            for folder in ['reports/tables', 'reports/figures']:
+                os.makedirs(folder, exist_ok=True)
+            # Warm-up on a small survey so lazy imports and caches are not billed to the first size
+            warmup_raw = synthetic.generate_survey(WARMUP_ROWS, n_courses, missing_rates, seed)
+            warmup_clean = data_cleaning.pre_process(warmup_raw, output_path=None)
+            for fn in selected.values():
+                _run_safely(lambda: fn(warmup_raw, warmup_clean, logger))
+
+            for n_rows in sizes:
+                raw = synthetic.generate_survey(n_rows, n_courses, missing_rates, seed)
+                clean = data_cleaning.pre_process(raw, output_path=None)
+                for name, fn in selected.items():
+                    try:
+                        result = {**measure_stage(lambda: fn(raw, clean, logger), repeats), 'Status': "ok"}
+                    except Exception as exc:  # A broken stage is reported, the others are still measured
+                        result = {'Seconds': float("nan"), 'CPU_Seconds': float("nan"), 'Peak_MB': float("nan"),
+                                  'Status': f"failed: {exc}"}
+                    rows.append({'Stage': name, 'Rows': n_rows, **result})
+                    logger.info(f"Benchmark {name} @ {n_rows} rows: {result['Seconds']:.3f}s, "
+                                f"{result['Peak_MB']:.1f} MB peak ({result['Status']})")
+                del raw, clean
+        finally:
+            os.chdir(previous_dir)
+
+    return compare_to_baseline(pd.DataFrame(rows), baseline, tolerance)
+
+def _run_safely(fn):
+    try:
+        fn()
+    except Exception:  # Failures are reported by the measured run
+        pass
+
+def measure_stage(fn, repeats=1):
+    """Best wall/CPU time over `repeats` runs, then the tracemalloc peak of one more run."""
+    seconds, cpu_seconds = float("inf"), float("inf")
+    for _ in range(repeats):
+        gc.collect()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        fn()
+        seconds = min(seconds, time.perf_counter() - wall_start)
+        cpu_seconds = min(cpu_seconds, time.process_time() - cpu_start)
+
+    # Tracing slows allocation-heavy code down, so memory is measured on a separate run
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'Seconds': seconds, 'CPU_Seconds': cpu_seconds, 'Peak_MB': peak / 2 ** 20}
+
+def compare_to_baseline(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """Adds the baseline figures and a Regression flag (slower or larger beyond the tolerance)."""
+    keys = results['Stage'] + "@" + results['Rows'].astype(str)
+    results['Baseline_Seconds'] = [baseline.get(key, {}).get('Seconds') for key in keys]
+    results['Baseline_Peak_MB'] = [baseline.get(key, {}).get('Peak_MB') for key in keys]
+    base_seconds = results['Baseline_Seconds'].astype(float)
+    base_peak = results['Baseline_Peak_MB'].astype(float)
+    slower = ((results['Seconds'] > base_seconds * (1 + tolerance))
+              & (results['Seconds'] - base_seconds > MIN_REGRESSION_SECONDS))
+    results['Regression'] = slower | (results['Peak_MB'] > base_peak * (1 + tolerance))
+    return results
+
+def load_baseline(path=BASELINE_PATH):
+    """Reads the stored baseline: {"stage@rows": {"Seconds": ..., "Peak_MB": ...}}."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_baseline(results, path=BASELINE_PATH):
+    """Stores (or updates) the baseline entries of a benchmark run."""
+    baseline = load_baseline(path)
+    for row in results[results['Status'] == "ok"].itertuples(index=False):
+        baseline[f"{row.Stage}@{row.Rows}"] = {'Seconds': row.Seconds, 'Peak_MB': row.Peak_MB}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+def main(argv=None):
+    """python -m SRC.benchmark [--rows N ...] [--stages ...] [--save-baseline]"""
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic surveys")
+    parser.add_argument('--rows', type=int, nargs='+', default=BENCHMARK_SIZES)
+    parser.add_argument('--stages', nargs='+', default=None, choices=list(benchmark_stages()))
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--courses', type=int, default=len(synthetic.COURSES))
+    parser.add_argument('--missing-rate', type=float, default=None,
+                        help="missing share for CGPA and Substance_Use (default: the rates of st_1.csv)")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the new baseline")
+    args = parser.parse_args(argv)
+
+    missing_rates = synthetic.MISSING_RATES if args.missing_rate is None else args.missing_rate
+    results = run_benchmarks(args.rows, args.stages, args.baseline, args.tolerance, args.repeats,
+                             args.courses, missing_rates)
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    results.to_csv(os.path.join(BENCHMARK_DIR, "latest.csv"), index=False)
+    print(results.to_string(index=False, float_format=lambda value: f"{value:.3f}"))
+
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        print(f"Baseline saved to {args.baseline}")
+    regressions = results[results['Regression']]
+    if len(regressions):
+        print(f"{len(regressions)} regression(s): {', '.join(regressions['Stage'] + '@' + regressions['Rows'].astype(str))}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
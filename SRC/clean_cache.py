@@ -0,0 +1,148 @@
+import hashlib
+import inspect
+import json
+import os
+from SRC import data_cleaning
+from SRC import storage
+from SRC import instrumentation
+
+CACHE_DIR = "data/cache"
+CACHE_FORMAT = storage.columnar_format()
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+# Next to the exported CSV: the cache key of the cleaned data it holds
+KEY_SUFFIX = ".key"
+# Rows per chunk of the streaming cleaner (see stream_clean_data)
+STREAM_CHUNKSIZE = 100_000
+
+@instrumentation.instrument
+def load_clean_data(raw_path, logger, output_path="data/clean_data.csv", columns=None, cache_dir=CACHE_DIR,
+                    max_cache_bytes=MAX_CACHE_BYTES, iqr_multiplier=data_cleaning.IQR_MULTIPLIER,
+                    sequential_bounds=True):
+    """
+    Returns the cleaned dataset for raw_path, re-running pre_process only when
+    the raw file content or the cleaning configuration has changed.
+    Cleaned frames are stored at full precision in a binary columnar format and
+    evicted by LRU; the returned frame has the compact dtypes of
+    data_cleaning.CLEAN_SCHEMA. Pass columns to load only the fields the caller needs.
+    """
+    key = cache_key(raw_path, iqr_multiplier, sequential_bounds)
+    entry_path = os.path.join(cache_dir, f"{key}.{CACHE_FORMAT}")
+
+    if os.path.exists(entry_path):
+        os.utime(entry_path)  # Mark the entry as most recently used
+        # The export may hold the output of another raw file (or configuration): restore it
+        if output_path and written_key(output_path) != key:
+            export_clean(storage.read_table(entry_path), output_path, key)
+        logger.info(f"Cleaned dataset loaded from cache ({key[:12]}).")
+        # Entries hold full precision; the compact dtypes are applied on every read
+        return data_cleaning.apply_schema(storage.read_table(entry_path, columns=columns))
+
+    # Only CSV needs dtype hints; binary formats already carry their column types
+    read_options = {'dtype': data_cleaning.READ_DTYPES} if storage.format_for(raw_path) == "csv" else {}
+    raw_data = storage.read_table(raw_path, **read_options)
+    if output_path:
+        _forget_key(output_path)  # pre_process overwrites the export
+    # The entry keeps full precision (e.g. float64 CGPA), so exports restored from it match a cold run
+    df_clean = data_cleaning.pre_process(raw_data, iqr_multiplier, sequential_bounds, output_path, schema=None)
+    df_clean = df_clean.reset_index(drop=True)
+    if output_path:
+        _remember_key(output_path, key)
+
+    storage.write_table(df_clean, entry_path)
+    evict_cache(cache_dir, max_cache_bytes, keep=entry_path)
+    logger.info(f"Cleaned dataset cached ({key[:12]}).")
+    return data_cleaning.apply_schema(df_clean if columns is None else df_clean[columns])
+
+def stream_clean_data(raw_path, logger, output_path="data/clean_data.csv", chunksize=STREAM_CHUNKSIZE,
+                      iqr_multiplier=data_cleaning.IQR_MULTIPLIER, sequential_bounds=True):
+    """
+    Cleans raw_path chunk by chunk straight into output_path (see
+    data_cleaning.pre_process_stream), for exports too large to load at once.
+    Nothing is cached, and the export carries no key file, so readers such as
+    load_exported use the export itself. Returns the number of rows written.
+    """
+    _forget_key(output_path)
+    rows = data_cleaning.pre_process_stream(raw_path, output_path, chunksize, iqr_multiplier, sequential_bounds)
+    logger.info(f"Cleaned dataset streamed to {output_path} ({rows} rows, {chunksize} per chunk).")
+    return rows
+
+def load_exported(output_path="data/clean_data.csv", columns=None, cache_dir=CACHE_DIR):
+    """
+    Reads the cleaned dataset that load_clean_data last exported to output_path,
+    without hashing the raw file or ever re-running pre_process: from the
+    columnar cache entry named by the export's key file while it exists, else
+    from the export itself. Returns a frame with the compact dtypes.
+    """
+    key = written_key(output_path)
+    entry_path = os.path.join(cache_dir, f"{key}.{CACHE_FORMAT}")
+    if key and os.path.exists(entry_path):
+        return data_cleaning.apply_schema(storage.read_table(entry_path, columns=columns))
+    if not os.path.exists(output_path):
+        raise FileNotFoundError(f"No cleaned dataset at {output_path}: run the clean stage first.")
+    dtypes = {col: 'category' for col in data_cleaning.CATEGORY_COLUMNS if columns is None or col in columns}
+    df = storage.read_table(output_path, columns=columns, dtype=dtypes)
+    return data_cleaning.apply_schema(df if columns is None else df[columns])  # usecols keeps the file order
+
+def cache_key(raw_path, iqr_multiplier=data_cleaning.IQR_MULTIPLIER, sequential_bounds=True):
+    """
+    Builds the cache key from the raw file's content hash and every setting that
+    changes the cleaned output, including the cleaning code itself.
+    """
+    config = {
+        'raw_sha256': file_digest(raw_path),
+        'stem_courses': data_cleaning.STEM_COURSES,
+        'ordinal_encodings': data_cleaning.ORDINAL_ENCODINGS,
+        'iqr_multiplier': iqr_multiplier,
+        'sequential_bounds': sequential_bounds,
+        'code_sha256': hashlib.sha256(inspect.getsource(data_cleaning).encode()).hexdigest(),
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+def export_clean(df, output_path, key):
+    """Writes the cleaned frame to output_path and records the cache key it belongs to."""
+    _forget_key(output_path)  # A crash mid-write must not leave the old key next to new rows
+    storage.write_table(df, output_path)
+    _remember_key(output_path, key)
+
+def written_key(output_path):
+    """The cache key of the cleaned data last exported to output_path (None when unknown)."""
+    try:
+        with open(output_path + KEY_SUFFIX) as f:
+            return f.read().strip() if os.path.exists(output_path) else None
+    except FileNotFoundError:
+        return None
+
+def _remember_key(output_path, key):
+    tmp_path = storage.temp_path(output_path + KEY_SUFFIX)
+    with open(tmp_path, "w") as f:
+        f.write(key)
+    os.replace(tmp_path, output_path + KEY_SUFFIX)
+
+def _forget_key(output_path):
+    try:
+        os.remove(output_path + KEY_SUFFIX)
+    except FileNotFoundError:
+        pass
+
+def file_digest(path, block_size=1 << 20):
+    """Returns the SHA-256 of a file, read in blocks so large exports are never fully in memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def evict_cache(cache_dir, max_cache_bytes, keep=None):
+    """Deletes the least recently used entries until the cache fits in max_cache_bytes."""
+    entries = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir)
+               if name.endswith(f".{CACHE_FORMAT}")]
+    entries.sort(key=os.path.getmtime)
+    total = sum(os.path.getsize(path) for path in entries)
+
+    for path in entries:
+        if total <= max_cache_bytes:
+            break
+        if path == keep:
+            continue
+        total -= os.path.getsize(path)
+        os.remove(path)
@@ -0,0 +1,195 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+import numpy as np
+import pandas as pd
+from SRC import storage
+
+CHUNK_ROWS = 1_000_000
+METHODS = ['pearson', 'spearman']
+
+def new_comoments(variables):
+    """
+    An empty co-moment accumulator. Every statistic is a variables x variables
+    matrix over pairwise-complete rows: n[i, j] counts the rows where both i and
+    j are present, mean[i, j] and m2[i, j] are the mean and the sum of squared
+    deviations of variable i over those rows, comoment[i, j] the sum of products
+    of the deviations of i and j.
+    """
+    p = len(variables)
+    return {'variables': list(variables), 'n': np.zeros((p, p)), 'mean': np.zeros((p, p)),
+            'm2': np.zeros((p, p)), 'comoment': np.zeros((p, p))}
+
+def chunk_comoments(values, variables):
+    """Co-moments of one in-memory block (rows x variables, NaN = missing)."""
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    weights = valid.astype(np.float64)
+    counts = weights.sum(axis=0)
+    # Centring on the block's column means keeps the sums of products well conditioned
+    shift = np.divide(np.where(valid, values, 0.0).sum(axis=0), counts, out=np.zeros(len(counts)), where=counts > 0)
+    centred = np.where(valid, values - shift, 0.0)
+
+    n = weights.T @ weights
+    sums = centred.T @ weights  # [i, j]: sum of variable i over the rows where i and j are present
+    means = np.divide(sums, n, out=np.zeros_like(n), where=n > 0)
+    return {'variables': list(variables), 'n': n, 'mean': means + shift[:, None],
+            'm2': (centred ** 2).T @ weights - sums * means,
+            'comoment': centred.T @ centred - sums * means.T}
+
+def merge_comoments(a, b):
+    """
+    Combines two accumulators over disjoint rows (Chan et al.'s pairwise
+    update), so chunks, files or worker results can be merged in any order.
+    """
+    if a['variables'] != b['variables']:
+        raise ValueError(f"Cannot merge co-moments of {a['variables']} and {b['variables']}.")
+    n = a['n'] + b['n']
+    delta = b['mean'] - a['mean']
+    share_b = np.divide(b['n'], n, out=np.zeros_like(n), where=n > 0)
+    weight = a['n'] * share_b  # n_a * n_b / n
+    return {'variables': a['variables'], 'n': n, 'mean': a['mean'] + delta * share_b,
+            'm2': a['m2'] + b['m2'] + delta ** 2 * weight,
+            'comoment': a['comoment'] + b['comoment'] + delta * delta.T * weight}
+
+def accumulate(source, variables, method='pearson', chunk_rows=CHUNK_ROWS, listwise=False, ranks=None):
+    """
+    Streams a source through the accumulator chunk by chunk, so only one chunk
+    is in memory at a time. source is a frame, a file path (CSV is read in
+    chunks), a callable returning an iterable of frames, or such an iterable.
+    Missing values are excluded pairwise, or whole rows with listwise=True.
+    method='spearman' replaces values by their ranks (mid-ranks for ties) from
+    a first pass of mergeable value counts; it needs a source that can be read twice.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown correlation method '{method}' (expected one of {METHODS}).")
+    variables = list(variables)
+    if method == 'spearman' and ranks is None:
+        ranks = rank_tables(value_counts(source, variables, chunk_rows, listwise))
+
+    acc = new_comoments(variables)
+    for chunk in iter_chunks(source, variables, chunk_rows):
+        values = chunk[variables].to_numpy(dtype=np.float64)
+        if listwise:
+            values = values[~np.isnan(values).any(axis=1)]
+        if ranks is not None:
+            values = _to_ranks(values, variables, ranks)
+        acc = merge_comoments(acc, chunk_comoments(values, variables))
+    return acc
+
+def accumulate_parallel(sources, variables, method='pearson', chunk_rows=CHUNK_ROWS, listwise=False,
+                        max_workers=None):
+    """
+    Accumulates several sources (e.g. one file per survey year) in a process
+    pool and merges the partial results. Spearman ranks are global: the value
+    counts of all sources are merged before the ranking pass.
+    """
+    sources = list(sources)
+    workers = min(max_workers or os.cpu_count() or 1, len(sources))
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    mapper = pool.map if pool else map
+    try:
+        ranks = None
+        if method == 'spearman':
+            counts = list(mapper(value_counts, sources, *_repeat(len(sources), variables, chunk_rows, listwise)))
+            ranks = rank_tables(reduce(merge_value_counts, counts))
+        partials = list(mapper(accumulate, sources, *_repeat(len(sources), variables, 'pearson', chunk_rows,
+                                                              listwise, ranks)))
+    finally:
+        if pool:
+            pool.shutdown()
+    return reduce(merge_comoments, partials, new_comoments(variables))
+
+def _repeat(count, *args):
+    """Argument columns for map(): every argument repeated once per source."""
+    return [[arg] * count for arg in args]
+
+def value_counts(source, variables, chunk_rows=CHUNK_ROWS, listwise=False):
+    """Mergeable counts of every distinct value per variable (survey values are discrete, so they stay small)."""
+    counts = {var: pd.Series(dtype=np.float64) for var in variables}
+    for chunk in iter_chunks(source, variables, chunk_rows):
+        frame = chunk[list(variables)].astype(np.float64)
+        if listwise:
+            frame = frame.dropna()
+        for var in variables:
+            counts[var] = counts[var].add(frame[var].value_counts(), fill_value=0)
+    return counts
+
+def merge_value_counts(a, b):
+    return {var: a[var].add(b[var], fill_value=0) for var in a}
+
+def rank_tables(counts):
+    """Sorted distinct values and their mid-ranks, per variable."""
+    tables = {}
+    for var, series in counts.items():
+        series = series.sort_index()
+        upper = series.cumsum().to_numpy()
+        tables[var] = (series.index.to_numpy(dtype=np.float64), upper - (series.to_numpy() - 1) / 2)
+    return tables
+
+def _to_ranks(values, variables, ranks):
+    """Replaces every value by its global mid-rank (missing values stay missing)."""
+    ranked = np.full_like(values, np.nan)
+    for j, var in enumerate(variables):
+        distinct, midranks = ranks[var]
+        present = ~np.isnan(values[:, j])
+        ranked[present, j] = midranks[np.searchsorted(distinct, values[present, j])]
+    return ranked
+
+def iter_chunks(source, columns, chunk_rows=CHUNK_ROWS):
+    """Yields frames of at most chunk_rows rows (a path's other formats are memory-mapped, then sliced)."""
+    if isinstance(source, str):
+        if storage.format_for(source) == "csv":
+            yield from pd.read_csv(source, usecols=list(columns), chunksize=chunk_rows)
+            return
+        source = storage.read_table(source, columns=list(columns))
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunk_rows):
+            yield source.iloc[start:start + chunk_rows]
+    else:
+        yield from (source() if callable(source) else source)
+
+def correlation(acc, variables=None):
+    """Correlation matrix (a labelled frame) of the accumulated variables, or of a subset."""
+    acc = _select(acc, variables)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = acc['comoment'] / np.sqrt(acc['m2'] * acc['m2'].T)
+    np.fill_diagonal(corr, np.where(np.diag(acc['m2']) > 0, 1.0, np.nan))
+    return pd.DataFrame(corr, index=acc['variables'], columns=acc['variables'])
+
+def covariance(acc, variables=None, ddof=1):
+    """Pairwise-complete covariance matrix (a labelled frame)."""
+    acc = _select(acc, variables)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = acc['comoment'] / (acc['n'] - ddof)
+    return pd.DataFrame(cov, index=acc['variables'], columns=acc['variables'])
+
+def observations(acc, variables=None):
+    """The smallest pairwise row count: the sample size behind every entry of the matrix."""
+    return int(_select(acc, variables)['n'].min())
+
+def correlation_matrix(source, variables, method='pearson', chunk_rows=CHUNK_ROWS):
+    """Out-of-core replacement for df[variables].corr(method) (pairwise-complete rows)."""
+    return correlation(accumulate(source, variables, method, chunk_rows))
+
+def _select(acc, variables):
+    """The accumulator restricted to a subset of its variables."""
+    if variables is None:
+        return acc
+    positions = [acc['variables'].index(var) for var in variables]
+    index = np.ix_(positions, positions)
+    return {'variables': list(variables), **{key: acc[key][index] for key in ['n', 'mean', 'm2', 'comoment']}}
+
+def save_comoments(acc, path):
+    """Stores an accumulator as .npz (through a temporary file) so later stages and runs can reuse it."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = storage.temp_path(path)
+    with open(tmp_path, "wb") as f:
+        np.savez(f, variables=np.array(acc['variables']),
+                 **{key: acc[key] for key in ['n', 'mean', 'm2', 'comoment']})
+    os.replace(tmp_path, path)
+
+def load_comoments(path):
+    with np.load(path) as data:
+        return {'variables': [str(var) for var in data['variables']],
+                **{key: data[key] for key in ['n', 'mean', 'm2', 'comoment']}}
@@ -1,56 +1,242 @@
+import math
+import numpy as np
 import pandas as pd
-def pre_process(df):    
+from SRC import storage
+from SRC import instrumentation
+
+STEM_COURSES = ['Engineering', 'Medical', 'Computer Science']
+OUTLIER_COLUMNS = ['Age', 'CGPA', 'Semester_Credit_Load']
+SCORE_COLUMNS = ['Stress_Level', 'Depression_Score', 'Anxiety_Score']
+IQR_MULTIPLIER = 1.5
+
+# Ordered levels per ordinal column; a level's code is its position + 1
+ORDINAL_ENCODINGS = {
+    'Sleep_Quality': ['Poor', 'Average', 'Good'],
+    'Social_Support': ['Low', 'Moderate', 'High'],
+    'Physical_Activity': ['Low', 'Moderate', 'High'],
+    'Diet_Quality': ['Poor', 'Average', 'Good'],
+    'Counseling_Service_Use': ['Never', 'Occasionally', 'Frequently'],
+    'Substance_Use': ['Never', 'Occasionally', 'Frequently'],
+}
+# read_csv dtypes that let encode_ordinals skip string hashing entirely
+ORDINAL_DTYPES = {col: 'category' for col in ORDINAL_ENCODINGS}
+# Free-text survey columns, held as categoricals from read time on
+CATEGORY_COLUMNS = ['Course', 'Gender', 'Relationship_Status', 'Residence_Type', 'Family_History',
+                    'Chronic_Illness', 'Extracurricular_Involvement']
+READ_DTYPES = {**{col: 'category' for col in CATEGORY_COLUMNS}, **ORDINAL_DTYPES}
+# Compact in-memory dtypes of the cleaned frame (see apply_schema)
+CLEAN_SCHEMA = {
+    **{col: 'category' for col in CATEGORY_COLUMNS},
+    **{col: 'int8' for col in SCORE_COLUMNS + ['Financial_Stress'] + list(ORDINAL_ENCODINGS)},
+    'Age': 'uint8',
+    'Semester_Credit_Load': 'uint8',
+    'Is_STEM': 'uint8',
+    'CGPA': 'float32',
+}
+
+@instrumentation.instrument
+def pre_process(df, iqr_multiplier=IQR_MULTIPLIER, sequential_bounds=True, output_path="data/clean_data.csv",
+                schema=CLEAN_SCHEMA):
     #level 1
     cgpa_mean = df["CGPA"].mean(skipna=True) # Calculate the mean CGPA (excluding missing values)
     df_clean = df.dropna(subset=["Substance_Use"]).copy() # Remove rows with missing values in Substance_Use
+
+    # levels 1-3 (fill, STEM flag, ordinal mapping) are shared with the streaming path
+    df_clean = _transform(df_clean, cgpa_mean)
+
+    # level 4a- Handling Outliers using IQR for continuous variables (Age, CGPA, Credit Load)
+    # level 4b- Logical Range Validation: scores must lie within the valid range [0, 5]
+    # Both checks are combined into one boolean mask and the frame is filtered once
+    bounds = outlier_bounds(df_clean, iqr_multiplier, sequential_bounds)
+    df_clean = df_clean[_bounds_mask(df_clean, bounds)]
+    # Save the final cleaned dataset (CSV, Feather, Parquet... chosen by the file extension)
+    # at full precision, then hand the compact typed frame to the analysis stages
+    if output_path:
+        storage.write_table(df_clean, output_path)
+    return apply_schema(df_clean, schema) if schema else df_clean
+
+@instrumentation.instrument
+def pre_process_stream(raw_path, output_path="data/clean_data.csv", chunksize=100_000,
+                       iqr_multiplier=IQR_MULTIPLIER, sequential_bounds=True):
+    """
+    Streaming variant of pre_process for survey exports too large to load at once.
+    Pass 1 gathers the CGPA mean and a mergeable sketch of the outlier columns,
+    pass 2 cleans chunk by chunk and appends the result to output_path.
+    Returns the number of rows written.
+    """
+    # Pass 1: global statistics (memory is bounded by distinct values, not rows)
+    cgpa_partials, cgpa_count, sketch = [], 0, None
+    for chunk in pd.read_csv(raw_path, chunksize=chunksize):
+        # Keep each chunk's exact sum and its rounding residual so the mean
+        # does not drift from the in-memory result as chunks accumulate
+        values = chunk["CGPA"].dropna().to_numpy()
+        chunk_sum = math.fsum(values)
+        cgpa_partials += [chunk_sum, math.fsum(np.append(values, -chunk_sum))]
+        cgpa_count += len(values)
+        part = outlier_sketch(chunk.dropna(subset=["Substance_Use"]))
+        sketch = part if sketch is None else merge_sketches(sketch, part)
+
+    cgpa_mean = math.fsum(cgpa_partials) / cgpa_count if cgpa_count else np.nan
+    bounds = sketch_bounds(sketch, cgpa_mean, iqr_multiplier, sequential_bounds)
+
+    # Pass 2: apply fill, mappings and the precomputed bounds, writing incrementally
+    rows_written = 0
+    for i, chunk in enumerate(pd.read_csv(raw_path, chunksize=chunksize, dtype=READ_DTYPES)):
+        chunk = _transform(chunk.dropna(subset=["Substance_Use"]).copy(), cgpa_mean)
+        chunk = chunk[_bounds_mask(chunk, bounds)]
+        chunk.to_csv(output_path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+        rows_written += len(chunk)
+    return rows_written
+
+def outlier_sketch(df):
+    """
+    Builds a mergeable sketch of the outlier columns: the count of every distinct
+    (Age, CGPA, Semester_Credit_Load) combination. Survey values are discrete,
+    so the sketch stays small while still giving exact quantiles.
+    """
+    return df.groupby(OUTLIER_COLUMNS, dropna=False).size()
+
+def merge_sketches(left, right):
+    """Combines two sketches built by outlier_sketch on disjoint sets of rows."""
+    return left.add(right, fill_value=0)
+
+def sketch_bounds(sketch, cgpa_mean, iqr_multiplier=IQR_MULTIPLIER, sequential_bounds=True):
+    """
+    Derives the (lower, upper) IQR bounds per outlier column from a sketch,
+    with the same sequential/simultaneous semantics as outlier_bounds.
+    """
+    cells = sketch.rename("count").reset_index()
+    cells["CGPA"] = cells["CGPA"].fillna(cgpa_mean)
+
+    bounds = {}
+    for col in OUTLIER_COLUMNS:
+        Q1, Q3 = _weighted_quantiles(cells[col], cells["count"], [0.25, 0.75])
+        bounds[col] = _iqr_bounds(Q1, Q3, iqr_multiplier)
+        if sequential_bounds:
+            lower_bound, upper_bound = bounds[col]
+            cells = cells[(cells[col] >= lower_bound) & (cells[col] <= upper_bound)]
+    return bounds
+
+def outlier_bounds(df, iqr_multiplier=IQR_MULTIPLIER, sequential_bounds=True):
+    """
+    Computes the (lower, upper) IQR bounds for every outlier column.
+    sequential_bounds=True reproduces the original semantics: each column's
+    quartiles are taken on the rows kept by the previous columns. Otherwise
+    all quartiles come from one quantile call on the full frame.
+    """
+    if not sequential_bounds:
+        quartiles = df[OUTLIER_COLUMNS].quantile([0.25, 0.75])
+        return {col: _iqr_bounds(quartiles.at[0.25, col], quartiles.at[0.75, col], iqr_multiplier)
+                for col in OUTLIER_COLUMNS}
+
+    # Track the surviving rows with a mask instead of materializing filtered frames
+    keep = np.ones(len(df), dtype=bool)
+    bounds = {}
+    for col in OUTLIER_COLUMNS:
+        values = df[col].to_numpy(dtype=float)
+        kept = values[keep & ~np.isnan(values)]
+        Q1, Q3 = np.quantile(kept, [0.25, 0.75]) if kept.size else (np.nan, np.nan)
+        bounds[col] = _iqr_bounds(Q1, Q3, iqr_multiplier)
+        lower_bound, upper_bound = bounds[col]
+        keep &= (values >= lower_bound) & (values <= upper_bound)
+    return bounds
+
+def _transform(df_clean, cgpa_mean):
+    """Applies the row-wise cleaning steps (levels 1-3) in place and returns the frame."""
     df_clean["CGPA"] = df_clean["CGPA"].fillna(cgpa_mean) # Fill missing CGPA values with the calculated mean
 
     #level 2- Feature Engineering: Create a binary variable 'Is_STEM'
     # Assign 1 for Engineering, Medical, and Computer Science; 0 for all others
-    stem_courses = ['Engineering', 'Medical', 'Computer Science']
-    df_clean['Is_STEM'] = df_clean['Course'].isin(stem_courses).astype(int)
+    df_clean['Is_STEM'] = df_clean['Course'].isin(STEM_COURSES).astype(int)
 
     # level 3- Data Transformation: Convert categorical variables to numerical values
-    # Define mapping: Poor/Low = 1, Average/Moderate = 2, Good/High = 3
-    sleep_mapping = {'Poor': 1, 'Average': 2, 'Good': 3}
-    support_mapping = {'Low': 1, 'Moderate': 2, 'High': 3}
-    physical_mapping= {'Low': 1, 'Moderate': 2, 'High': 3}
-    diet_mapping = {'Poor': 1, 'Average': 2, 'Good': 3}
-    counseling_mapping= {'Never':1, 'Occasionally':2,'Frequently':3}
-    substance_mapping= {'Never':1, 'Occasionally':2,'Frequently':3}
-
-    # Apply the mapping to the respective columns
-    df_clean['Sleep_Quality'] = df_clean['Sleep_Quality'].map(sleep_mapping)
-    df_clean['Social_Support'] = df_clean['Social_Support'].map(support_mapping)
-    df_clean['Physical_Activity']=df_clean['Physical_Activity'].map(physical_mapping)
-    df_clean['Diet_Quality']=df_clean['Diet_Quality'].map(diet_mapping)
-    df_clean['Counseling_Service_Use']=df_clean['Counseling_Service_Use'].map(counseling_mapping)
-    df_clean['Substance_Use']=df_clean['Substance_Use'].map(substance_mapping)
-
-
-    # level 4a- Handling Outliers using IQR for continuous variables
-    # This will remove extreme/unrealistic values for Age, CGPA, and Credit Load
-    outlier_columns = ['Age', 'CGPA', 'Semester_Credit_Load']
-
-    for col in outlier_columns:
-        Q1 = df_clean[col].quantile(0.25)
-        Q3 = df_clean[col].quantile(0.75)
-        IQR = Q3 - Q1
-        lower_bound = Q1 - 1.5 * IQR
-        upper_bound = Q3 + 1.5 * IQR
-        # Filter the data to keep only values within the calculated bounds
-        df_clean = df_clean[(df_clean[col] >= lower_bound) & (df_clean[col] <= upper_bound)]
-
-    # level 4b- Logical Range Validation for score columns
-    # Ensure that scores like Stress, Depression, and Anxiety are within the valid range [0, 5]
-    score_columns = ['Stress_Level', 'Depression_Score', 'Anxiety_Score']
-
-    for col in score_columns:
-        # Filter out any values that are negative or greater than 5
-        df_clean = df_clean[(df_clean[col] >= 0) & (df_clean[col] <= 5)]
-   # Save the final cleaned dataset as st1.csv
-    df_clean.to_csv("data/clean_data.csv", index=False)
+    # Poor/Low/Never = 1, Average/Moderate/Occasionally = 2, Good/High/Frequently = 3
+    encode_ordinals(df_clean)
     return df_clean
 
-        
+def encode_ordinals(df, encodings=ORDINAL_ENCODINGS):
+    """
+    Converts every ordinal column listed in encodings to compact nullable Int8 codes.
+    Each column is reduced to categorical codes (free when it was read as a
+    categorical) and translated through a small lookup array in a single take.
+    Labels outside the table become <NA>, as with Series.map. The dtype does not
+    depend on the data, so chunks encoded separately export the same text.
+    """
+    for col, levels in encodings.items():
+        if col not in df.columns:
+            continue
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            codes, labels = df[col].cat.codes.to_numpy(), df[col].cat.categories
+        else:
+            codes, labels = pd.factorize(df[col])
+
+        # The extra last slot (code 0) catches missing cells, whose code is -1
+        lookup = np.zeros(len(labels) + 1, dtype=np.int8)
+        positions = pd.Index(labels).get_indexer(levels)
+        found = positions >= 0
+        lookup[positions[found]] = np.arange(1, len(levels) + 1, dtype=np.int8)[found]
+
+        encoded = lookup[codes]
+        df[col] = pd.arrays.IntegerArray(encoded, encoded == 0)
+    return df
+
+def apply_schema(df, schema=CLEAN_SCHEMA):
+    """
+    Casts the columns of a cleaned frame to their compact dtypes: categoricals
+    for the text columns, int8/uint8 for scores, codes and flags, float32 for CGPA.
+    An integer column that holds missing or out-of-range values keeps its dtype,
+    so the cast never changes a value. Columns not in the schema are left alone.
+    """
+    casts = {}
+    for col, dtype in schema.items():
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        if dtype != 'category' and np.issubdtype(np.dtype(dtype), np.integer):
+            values = df[col].to_numpy(dtype=float)
+            limits = np.iinfo(dtype)
+            if not (np.isfinite(values).all() and (values % 1 == 0).all()
+                    and ((values >= limits.min) & (values <= limits.max)).all()):
+                continue
+        casts[col] = dtype
+    return df.astype(casts) if casts else df
+
+def _iqr_bounds(Q1, Q3, iqr_multiplier=IQR_MULTIPLIER):
+    """Returns the Tukey fences (Q1 - k*IQR, Q3 + k*IQR)."""
+    IQR = Q3 - Q1
+    return Q1 - iqr_multiplier * IQR, Q3 + iqr_multiplier * IQR
+
+def _bounds_mask(df, bounds):
+    """Boolean mask of rows inside every IQR bound and inside the [0, 5] score range."""
+    mask = np.ones(len(df), dtype=bool)
+    for col, (lower_bound, upper_bound) in bounds.items():
+        values = df[col].to_numpy()
+        mask &= (values >= lower_bound) & (values <= upper_bound)
+    for col in SCORE_COLUMNS:
+        values = df[col].to_numpy()
+        mask &= (values >= 0) & (values <= 5)
+    return mask
+
+def _weighted_quantiles(values, counts, probs):
+    """
+    Linear-interpolation quantiles of values repeated counts times.
+    Mirrors numpy's 'linear' method so results equal Series.quantile on the expanded data.
+    """
+    valid = values.notna().to_numpy()
+    v = values.to_numpy(dtype=float)[valid]
+    c = counts.to_numpy()[valid]
+    order = np.argsort(v, kind="stable")
+    v, cum = v[order], np.cumsum(c[order])
+    if not cum.size or cum[-1] == 0:
+        return [np.nan] * len(probs)
+    n = cum[-1]
 
+    result = []
+    for q in probs:
+        h = n * q - q  # virtual index used by numpy for the linear method
+        lo = np.floor(h)
+        a = v[np.searchsorted(cum, lo, side="right")]
+        b = v[np.searchsorted(cum, min(lo + 1, n - 1), side="right")]
+        t = h - lo
+        diff = b - a
+        result.append(b - diff * (1 - t) if t >= 0.5 else a + diff * t)
+    return result
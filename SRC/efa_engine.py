@@ -0,0 +1,265 @@
+import argparse
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+import numpy as np
+import pandas as pd
+from SRC import correlation
+from SRC import instrumentation
+from SRC import report_sink
+
+# The item space scanned per cohort: distress scores and the ordinal-coded lifestyle items
+DISTRESS_ITEMS = ['Stress_Level', 'Depression_Score', 'Anxiety_Score', 'Financial_Stress']
+LIFESTYLE_ITEMS = ['Sleep_Quality', 'Physical_Activity', 'Diet_Quality', 'Social_Support',
+                   'Counseling_Service_Use', 'Substance_Use']
+ITEM_SPACE = DISTRESS_ITEMS + LIFESTYLE_ITEMS
+KMO_THRESHOLD = 0.6
+BARTLETT_ALPHA = 0.05
+# Uniqueness bounds of the MINRES fit (the factor_analyzer defaults)
+UNIQUENESS_BOUNDS = (0.005, 1)
+SCAN_PATH = "reports/tables/efa_scan.csv"
+# Label of the pooled cohort in every grouping column
+ALL_ROWS = 'All'
+CHUNK_ROWS = 1_000_000
+CLEAN_PATH = "data/clean_data.csv"
+
+def cohort_moments(data, variables, group_cols=None, chunk_rows=CHUNK_ROWS):
+    """
+    One streaming pass over the rows (a frame, a file path, or an iterable of
+    frames) feeding one co-moment accumulator (see the correlation module) per
+    cohort. The pooled rows form the cohort labelled 'All' in every grouping
+    column. Rows missing any variable are left out (listwise deletion), so every
+    entry of a cohort's matrix rests on the same rows.
+    Returns {cohort key tuple: accumulator}.
+    """
+    variables = list(variables)
+    group_cols = [group_cols] if isinstance(group_cols, str) else list(group_cols or [])
+    pooled = (ALL_ROWS,) * len(group_cols)
+    moments = {}
+
+    for chunk in correlation.iter_chunks(data, variables + group_cols, chunk_rows):
+        chunk = chunk.dropna(subset=variables)
+        values = chunk[variables].to_numpy(dtype=np.float64)
+        if not len(values):
+            continue
+
+        cohorts = {pooled: slice(None)}
+        if group_cols:
+            for key, rows in chunk.groupby(group_cols, observed=True, sort=False).indices.items():
+                cohorts[key if isinstance(key, tuple) else (key,)] = rows
+        for key, rows in cohorts.items():
+            part = correlation.chunk_comoments(values[rows], variables)
+            moments[key] = correlation.merge_comoments(moments[key], part) if key in moments else part
+    return moments
+
+def correlation_from_moments(acc):
+    """Pearson correlation matrix (ndarray) and row count of one cohort's accumulator."""
+    return correlation.correlation(acc).to_numpy(), correlation.observations(acc)
+
+def correlation_matrix(data, variables, chunk_rows=CHUNK_ROWS):
+    """The pooled correlation matrix (as a labelled frame) and its row count, in one pass."""
+    acc = correlation.accumulate(data, variables, chunk_rows=chunk_rows, listwise=True)
+    return correlation.correlation(acc), correlation.observations(acc)
+
+def kmo(corr):
+    """
+    Kaiser-Meyer-Olkin sampling adequacy from a correlation matrix: the share of
+    squared correlations against squared partial correlations.
+    Returns (per-item KMO, overall KMO).
+    """
+    corr = np.asarray(corr, dtype=float)
+    inverse = _inverse(corr)
+    partial = -inverse / np.sqrt(np.outer(np.diag(inverse), np.diag(inverse)))
+    off_diagonal = ~np.eye(len(corr), dtype=bool)
+    corr_sq = np.where(off_diagonal, corr ** 2, 0).sum(axis=0)
+    partial_sq = np.where(off_diagonal, partial ** 2, 0).sum(axis=0)
+    return corr_sq / (corr_sq + partial_sq), corr_sq.sum() / (corr_sq.sum() + partial_sq.sum())
+
+def bartlett_sphericity(corr, n):
+    """Bartlett's test that the correlation matrix is the identity. Returns (chi-square, p-value)."""
+    from scipy import stats  # Imported on first use, like the other statistical helpers
+    corr = np.asarray(corr, dtype=float)
+    p = len(corr)
+    _, log_det = np.linalg.slogdet(corr)
+    statistic = -log_det * (n - 1 - (2 * p + 5) / 6)
+    return statistic, stats.chi2.sf(statistic, p * (p - 1) / 2)
+
+def extract_factors(corr, n_factors=1, rotation="varimax", bounds=UNIQUENESS_BOUNDS):
+    """
+    MINRES factor extraction from a correlation matrix (the same objective,
+    starting point and optimizer as factor_analyzer's default fit), followed by
+    a varimax rotation when there is more than one factor. Factor signs are
+    set so every column sums positive, and factors are ordered by variance.
+    Returns the loading matrix (items x factors).
+    """
+    from scipy.optimize import minimize
+    corr = np.asarray(corr, dtype=float)
+    # Start from the uniquenesses implied by the squared multiple correlations
+    start = 1 / np.diag(_inverse(corr))
+    result = minimize(_minres_objective, start, method="L-BFGS-B", jac=True, bounds=[bounds] * len(corr),
+                      options={'maxiter': 1000}, args=(corr, n_factors))
+    loadings = _minres_loadings(result.x, corr, n_factors)
+
+    if rotation == "varimax" and n_factors > 1:
+        loadings = varimax(loadings)
+    signs = np.where(loadings.sum(axis=0) < 0, -1.0, 1.0)
+    loadings = loadings * signs
+    return loadings[:, np.argsort(-(loadings ** 2).sum(axis=0), kind="stable")]
+
+def _minres_objective(uniquenesses, corr, n_factors):
+    """
+    Sum of squared residuals between the reduced correlation matrix and its
+    factor model, with its gradient: the residual is what the leading
+    eigenpairs leave over, so d/d(uniqueness_i) is -2 * residual_ii.
+    The analytic gradient saves the optimizer one eigendecomposition per item.
+    """
+    loadings = _minres_loadings(uniquenesses, corr, n_factors, floor=np.finfo(float).eps * 100)
+    reduced = corr.copy()
+    np.fill_diagonal(reduced, 1 - uniquenesses)
+    residual = reduced - loadings @ loadings.T
+    return np.sum(residual ** 2), -2 * np.diag(residual)
+
+def _minres_loadings(uniquenesses, corr, n_factors, floor=0.0):
+    """Loadings from the leading eigenpairs of the reduced correlation matrix."""
+    reduced = corr.copy()
+    np.fill_diagonal(reduced, 1 - uniquenesses)
+    values, vectors = np.linalg.eigh(reduced)
+    values = np.maximum(values[::-1][:n_factors], floor)
+    return vectors[:, ::-1][:, :n_factors] * np.sqrt(values)
+
+def varimax(loadings, max_iter=500, tol=1e-5):
+    """Varimax rotation with Kaiser normalization."""
+    norms = np.sqrt((loadings ** 2).sum(axis=1, keepdims=True))
+    x = loadings / norms
+    rotation = np.eye(x.shape[1])
+    criterion = 0
+    for _ in range(max_iter):
+        basis = x @ rotation
+        u, s, vt = np.linalg.svd(x.T @ (basis ** 3 - basis * (basis ** 2).sum(axis=0) / len(x)))
+        rotation = u @ vt
+        previous, criterion = criterion, s.sum()
+        if criterion < previous * (1 + tol):
+            break
+    return x @ rotation * norms
+
+def _inverse(matrix):
+    """Matrix inverse, falling back to the pseudo-inverse for a singular matrix."""
+    try:
+        return np.linalg.inv(matrix)
+    except np.linalg.LinAlgError:
+        return np.linalg.pinv(matrix)
+
+def max_factors(n_items):
+    """Largest factor count that still leaves non-negative model degrees of freedom."""
+    return max(k for k in range(n_items) if (n_items - k) ** 2 - (n_items + k) >= 0)
+
+def candidate_sets(items=ITEM_SPACE, min_size=3, max_size=None):
+    """Every subset of the items with min_size to max_size members, as lists."""
+    max_size = max_size or len(items)
+    return [list(subset) for size in range(min_size, max_size + 1) for subset in combinations(items, size)]
+
+def evaluate_variable_set(corr, n, variables, factor_counts=(1, 2, 3)):
+    """
+    KMO and Bartlett for one variable set, then a MINRES fit for every factor
+    count the set can identify. Everything is derived from the correlation
+    matrix, so no data pass is needed. Returns one record per factor count.
+    """
+    corr = np.asarray(corr, dtype=float)
+    _, kmo_model = kmo(corr)
+    chi_square, p_value = bartlett_sphericity(corr, n)
+    base = {'Variables': "+".join(variables), 'N_Items': len(variables), 'Rows': n,
+            'KMO': kmo_model, 'Bartlett_Chi2': chi_square, 'Bartlett_P': p_value,
+            'Suitable': bool(kmo_model > KMO_THRESHOLD and p_value < BARTLETT_ALPHA)}
+
+    records = []
+    for n_factors in [k for k in factor_counts if 1 <= k <= max_factors(len(variables))]:
+        loadings = extract_factors(corr, n_factors)
+        communalities = (loadings ** 2).sum(axis=1)
+        residual = corr - loadings @ loadings.T
+        off_diagonal = ~np.eye(len(corr), dtype=bool)
+        records.append({**base, 'N_Factors': n_factors,
+                        'Variance_Explained': communalities.sum() / len(variables),
+                        'Min_Communality': communalities.min(),
+                        'RMSR': np.sqrt(np.mean(residual[off_diagonal] ** 2))})
+    return records
+
+def _evaluate_task(task):
+    """Evaluates one (cohort, variable set) inside a worker; failures become a Status."""
+    cohort, variables, corr, n, factor_counts = task
+    try:
+        records = evaluate_variable_set(corr, n, variables, factor_counts)
+        return [{**cohort, **record, 'Status': "ok"} for record in records]
+    except (np.linalg.LinAlgError, ValueError) as exc:  # e.g. a constant item inside a small cohort
+        return [{**cohort, 'Variables': "+".join(variables), 'N_Items': len(variables), 'Rows': n,
+                 'Status': f"failed: {exc}"}]
+
+@instrumentation.instrument
+def scan_efa(data, logger, variable_sets=None, factor_counts=(1, 2, 3), group_cols=None,
+             max_workers=None, min_rows=10, output_path=SCAN_PATH, chunk_rows=CHUNK_ROWS):
+    """
+    Scans candidate variable sets and factor counts for every cohort.
+    The correlation matrix of the union of all items is accumulated once per
+    cohort in a single streaming pass; each (cohort, variable set) task then only
+    receives its small sub-matrix, and the tasks run in a process pool.
+    data is a frame, a file path or an iterable of frames; variable_sets
+    defaults to every subset of three or more ITEM_SPACE items. Results are
+    written to output_path (when given) and returned, one row per cohort,
+    variable set and factor count.
+    """
+    variable_sets = [list(s) for s in (variable_sets or candidate_sets())]
+    variables = list(dict.fromkeys(v for s in variable_sets for v in s))
+    group_cols = [group_cols] if isinstance(group_cols, str) else list(group_cols or [])
+    logger.info(f"--- STARTING EFA SCAN ({len(variable_sets)} variable sets, factor counts {list(factor_counts)}) ---")
+
+    moments = cohort_moments(data, variables, group_cols, chunk_rows)
+    tasks = []
+    for key, acc in moments.items():
+        corr, n = correlation_from_moments(acc)
+        if n < min_rows:
+            continue
+        cohort = dict(zip(group_cols, key))
+        for subset in variable_sets:
+            positions = [variables.index(v) for v in subset]
+            tasks.append((cohort, subset, corr[np.ix_(positions, positions)], n, tuple(factor_counts)))
+
+    workers = min(max_workers or os.cpu_count() or 1, len(tasks)) if tasks else 1
+    if workers <= 1:
+        results = [_evaluate_task(task) for task in tasks]
+    else:
+        # Tasks are tiny, so they are handed out in large chunks
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_evaluate_task, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+
+    columns = group_cols + ['Variables', 'N_Items', 'N_Factors', 'Rows', 'KMO', 'Bartlett_Chi2', 'Bartlett_P',
+                            'Suitable', 'Variance_Explained', 'Min_Communality', 'RMSR', 'Status']
+    scan = pd.DataFrame([record for records in results for record in records], columns=columns)
+    if output_path:
+        report_sink.write_table(scan.round(4), output_path, index=False)
+    logger.info(f"EFA scan finished: {len(tasks)} (cohort, variable set) pairs over {len(moments)} cohorts, "
+                f"{int(scan['Suitable'].fillna(False).astype(bool).sum())} suitable models.")
+    return scan
+
+def main(argv=None):
+    """python -m SRC.efa_engine [--by Course ...] [--items ...] [--max-items N] [--factors 1 2 3]"""
+    parser = argparse.ArgumentParser(description="Scan EFA models over item subsets, factor counts and cohorts")
+    parser.add_argument('--data', default=CLEAN_PATH, help="cleaned survey CSV (streamed in chunks)")
+    parser.add_argument('--by', nargs='*', default=['Course'], help="cohort columns (none: pooled data only)")
+    parser.add_argument('--items', nargs='+', default=ITEM_SPACE)
+    parser.add_argument('--min-items', type=int, default=3)
+    parser.add_argument('--max-items', type=int, default=None)
+    parser.add_argument('--factors', type=int, nargs='+', default=[1, 2, 3])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default=SCAN_PATH)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    scan = scan_efa(args.data, logging.getLogger(__name__), candidate_sets(args.items, args.min_items, args.max_items),
+                    args.factors, args.by, args.workers, output_path=args.output)
+    # Suitable models first, then the best sampling adequacy
+    best = scan.sort_values(['Suitable', 'KMO'], ascending=False)
+    print(best.head(20).to_string(index=False, float_format=lambda value: f"{value:.3f}"))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,228 @@
+import hashlib
+import io
+import json
+import math
+import os
+import numpy as np
+import pandas as pd
+from SRC import data_cleaning
+from SRC import predictive_modeling
+from SRC import stats_analysis
+from SRC import storage
+from SRC import instrumentation
+
+STATE_DIR = "data/incremental"
+METRICS = ['Stress_Level', 'Depression_Score', 'Anxiety_Score']
+# A cell holds every row with the same course and outlier-column values, so the
+# IQR bounds can still be derived exactly (and re-derived as new waves move them)
+CELL_KEYS = ['Course'] + data_cleaning.OUTLIER_COLUMNS
+RAW_COLUMNS = CELL_KEYS + ['Substance_Use'] + data_cleaning.SCORE_COLUMNS
+# The incremental t-test table has no resampling columns (those need the rows), so it
+# gets its own file instead of replacing the full run's t_test_results.csv
+T_TEST_FILE = "t_test_results_incremental.csv"
+# Bytes before the watermark that must be unchanged for the file to count as appended to
+TAIL_CHECK_BYTES = 64 * 1024
+
+@instrumentation.instrument
+def update_incremental_state(raw_path, logger, state_dir=STATE_DIR, metrics=METRICS):
+    """
+    Folds the rows appended to raw_path since the last call into the persisted
+    state and saves it. Only the new bytes of the file are read; if the file was
+    rewritten instead of appended to, the state is rebuilt from scratch.
+    Returns the updated state.
+    """
+    state = load_state(state_dir, metrics)
+    with open(raw_path, "rb") as f:
+        header = f.readline()
+        if not _is_append_of(f, state, header):
+            logger.info("Raw file was rewritten: rebuilding the incremental state.")
+            state = new_state(metrics)
+        offset = state['raw_offset'] or len(header)
+        f.seek(offset)
+        delta = f.read()
+
+    # Only complete lines are consumed; a partially written last row waits for the next update
+    delta = delta[:delta.rfind(b"\n") + 1]
+    n_new = 0
+    if delta:
+        new_rows = pd.read_csv(io.BytesIO(header + delta), usecols=RAW_COLUMNS)
+        fold_rows(state, new_rows)
+        n_new = len(new_rows)
+    state['raw_offset'] = offset + len(delta)
+    state['header'] = header.decode()
+    with open(raw_path, "rb") as f:
+        state['tail_sha256'] = _tail_digest(f, state['raw_offset'])
+
+    save_state(state, state_dir)
+    logger.info(f"Incremental state updated with {n_new} new rows "
+                f"({len(state['cells'])} cells).")
+    return state
+
+def new_state(metrics=METRICS):
+    """Returns an empty state: no rows seen, no cells."""
+    return {
+        'metrics': list(metrics),
+        'raw_offset': 0,
+        'header': None,
+        'tail_sha256': None,
+        'cgpa_partials': [],
+        'cgpa_count': 0,
+        'cells': pd.DataFrame(columns=_stat_columns(metrics), dtype=float,
+                              index=pd.MultiIndex.from_arrays([[]] * len(CELL_KEYS), names=CELL_KEYS)),
+    }
+
+def fold_rows(state, raw_rows):
+    """
+    Merges a batch of raw survey rows into the state. The state is additive,
+    so folding waves one at a time equals folding them all at once.
+    """
+    # CGPA mean: keep the exact sum and its rounding residual (as in pre_process_stream)
+    values = raw_rows["CGPA"].dropna().to_numpy(dtype=float)
+    batch_sum = math.fsum(values)
+    state['cgpa_partials'] += [batch_sum, math.fsum(np.append(values, -batch_sum))]
+    state['cgpa_count'] += len(values)
+
+    merged = pd.concat([state['cells'], cell_moments(raw_rows, state['metrics'])])
+    state['cells'] = merged.groupby(level=CELL_KEYS, dropna=False, sort=True).sum()
+    return state
+
+def cell_moments(raw_rows, metrics=METRICS):
+    """
+    Per-cell mergeable statistics of raw rows: the row count used for the IQR
+    bounds, then (over rows with valid scores) the count, sums, sums of squares,
+    high-risk counts and cross products of the metrics.
+    """
+    rows = raw_rows.dropna(subset=["Substance_Use"])
+    scores = rows[data_cleaning.SCORE_COLUMNS].to_numpy(dtype=float)
+    valid = ((scores >= 0) & (scores <= 5)).all(axis=1).astype(float)
+
+    values = rows[metrics].to_numpy(dtype=float) * valid[:, None]
+    values = np.nan_to_num(values)
+    stats = {'rows': np.ones(len(rows)), 'n': valid}
+    for i, a in enumerate(metrics):
+        stats[f"sum:{a}"] = values[:, i]
+        stats[f"sumsq:{a}"] = values[:, i] ** 2
+        stats[f"high:{a}"] = valid * (values[:, i] > predictive_modeling.HIGH_RISK_THRESHOLD)
+        for j in range(i + 1, len(metrics)):
+            stats[f"cross:{a}:{metrics[j]}"] = values[:, i] * values[:, j]
+
+    frame = pd.DataFrame(stats, index=rows.index)
+    return frame.groupby([rows[key] for key in CELL_KEYS], dropna=False, sort=True).sum()
+
+def clean_cells(state, iqr_multiplier=data_cleaning.IQR_MULTIPLIER, sequential_bounds=True):
+    """
+    Applies the cleaning filter of pre_process to the cells: the IQR bounds are
+    derived from the cell counts (the outlier sketch of all rows seen so far)
+    and cells outside them are dropped. Returns the kept cells with an Is_STEM column.
+    """
+    cells = state['cells']
+    cgpa_mean = math.fsum(state['cgpa_partials']) / state['cgpa_count'] if state['cgpa_count'] else np.nan
+    sketch = cells['rows'].groupby(level=data_cleaning.OUTLIER_COLUMNS, dropna=False).sum()
+    bounds = data_cleaning.sketch_bounds(sketch, cgpa_mean, iqr_multiplier, sequential_bounds)
+
+    keys = cells.index.to_frame(index=False)
+    keys['CGPA'] = keys['CGPA'].fillna(cgpa_mean)
+    mask = np.ones(len(cells), dtype=bool)
+    for col, (lower_bound, upper_bound) in bounds.items():
+        values = keys[col].to_numpy(dtype=float)
+        mask &= (values >= lower_bound) & (values <= upper_bound)
+
+    kept = cells[mask & (cells['n'].to_numpy() > 0)]
+    courses = kept.index.get_level_values('Course')
+    return kept.assign(Is_STEM=courses.isin(data_cleaning.STEM_COURSES).astype(int))
+
+def state_moments(kept, group_col, metrics=METRICS):
+    """Per-group moments of the kept cells, in the layout of stats_analysis.group_moments."""
+    groups = kept.index.get_level_values(group_col) if group_col in kept.index.names else kept[group_col]
+    totals = kept.groupby(groups, observed=True, sort=True).sum()
+    return pd.concat({
+        'count': pd.DataFrame({m: totals['n'] for m in metrics}),
+        'sum': totals[[f"sum:{m}" for m in metrics]].set_axis(metrics, axis=1),
+        'sumsq': totals[[f"sumsq:{m}" for m in metrics]].set_axis(metrics, axis=1),
+    }, axis=1)
+
+def state_risk_table(kept, targets=predictive_modeling.RISK_TARGETS):
+    """Risk table in the layout of predictive_modeling.compute_risk_table."""
+    totals = kept.groupby(level='Course', sort=True).sum()
+    table = pd.DataFrame({(col, stat): totals['n' if stat == 'count' else f"high:{col}"]
+                          for col in targets for stat in ('sum', 'count')})
+    for col in targets:
+        table[(col, 'rate')] = table[(col, 'sum')] / table[(col, 'count')] * 100
+    return table
+
+def state_correlation(kept, metrics=METRICS):
+    """Pearson correlation matrix of the metrics from the pooled co-moments."""
+    totals = kept.sum()
+    n = totals['n']
+    means = np.array([totals[f"sum:{m}"] for m in metrics]) / n
+    cov = np.empty((len(metrics), len(metrics)))
+    for i, a in enumerate(metrics):
+        cov[i, i] = totals[f"sumsq:{a}"] - n * means[i] ** 2
+        for j in range(i + 1, len(metrics)):
+            cov[i, j] = cov[j, i] = totals[f"cross:{a}:{metrics[j]}"] - n * means[i] * means[j]
+    scale = np.sqrt(np.diag(cov))
+    return pd.DataFrame(cov / np.outer(scale, scale), index=metrics, columns=metrics)
+
+@instrumentation.instrument
+def run_incremental_reports(state, logger, output_dir="reports/tables", n_resamples=0, seed=None,
+                            heatmap=True):
+    """
+    Regenerates the T-Test, ANOVA/Tukey and risk reports (and the correlation
+    heatmap) from the state alone; no survey rows are read. The t-test table
+    carries the moment-based columns only, as its resampling columns need the rows,
+    and is written to T_TEST_FILE.
+    """
+    metrics = state['metrics']
+    kept = clean_cells(state)
+    logger.info(f"Incremental reports from {int(kept['n'].sum())} cleaned rows.")
+
+    comparison = stats_analysis.compare_moments(state_moments(kept, 'Is_STEM', metrics), metrics)
+    stats_analysis.save_t_test_table([stats_analysis._t_test_record(comparison, var) for var in metrics],
+                                     logger, output_dir, T_TEST_FILE)
+    stats_analysis.report_anova_and_tukey(state_moments(kept, 'Course', metrics), metrics, logger, output_dir)
+    predictive_modeling.write_risk_report(state_risk_table(kept), logger, output_dir, n_resamples, seed)
+    if heatmap:
+        from SRC import visualization  # Plotting libraries are only loaded when a figure is drawn
+        visualization.plot_correlation_heatmap(None, metrics, logger, corr_matrix=state_correlation(kept, metrics))
+
+def load_state(state_dir=STATE_DIR, metrics=METRICS):
+    """Loads the persisted state, or a new one when none exists for these metrics."""
+    meta_path = os.path.join(state_dir, "state.json")
+    cells_path = os.path.join(state_dir, f"cells.{storage.columnar_format()}")
+    if not (os.path.exists(meta_path) and os.path.exists(cells_path)):
+        return new_state(metrics)
+    with open(meta_path) as f:
+        state = json.load(f)
+    if state['metrics'] != list(metrics):
+        return new_state(metrics)
+    state['cells'] = storage.read_table(cells_path).set_index(CELL_KEYS)
+    return state
+
+def save_state(state, state_dir=STATE_DIR):
+    """Writes the state as a JSON header plus a columnar cell table."""
+    os.makedirs(state_dir, exist_ok=True)
+    storage.write_table(state['cells'].reset_index(), os.path.join(state_dir, f"cells.{storage.columnar_format()}"))
+    meta = {key: value for key, value in state.items() if key != 'cells'}
+    with open(os.path.join(state_dir, "state.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+def _is_append_of(f, state, header):
+    """True when the open raw file still starts with the bytes the state was built from."""
+    if not state['raw_offset']:
+        return True
+    size = f.seek(0, os.SEEK_END)
+    return (state['header'] == header.decode() and size >= state['raw_offset']
+            and _tail_digest(f, state['raw_offset']) == state['tail_sha256'])
+
+def _tail_digest(f, offset):
+    """SHA-256 of the TAIL_CHECK_BYTES bytes before offset (cheap check that the prefix is intact)."""
+    start = max(0, offset - TAIL_CHECK_BYTES)
+    f.seek(start)
+    return hashlib.sha256(f.read(offset - start)).hexdigest()
+
+def _stat_columns(metrics):
+    columns = ['rows', 'n']
+    for i, a in enumerate(metrics):
+        columns += [f"sum:{a}", f"sumsq:{a}", f"high:{a}"]
+        columns += [f"cross:{a}:{b}" for b in metrics[i + 1:]]
+    return columns
@@ -0,0 +1,120 @@
+import cProfile
+import functools
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import pandas as pd
+import psutil
+
+METRICS_PATH = "logs/pipeline_metrics.jsonl"
+PROFILE_DIR = "logs/profiles"
+# Settings live in the environment so worker processes of the stage pools inherit them
+PROFILE_ENV = "PIPELINE_PROFILE"
+TRACE_MEMORY_ENV = "PIPELINE_TRACE_MEMORY"
+
+# Nesting depth of instrumented calls in this process (only the outermost one is profiled)
+_depth = 0
+
+def configure(profile=False, trace_memory=False):
+    """
+    Turns on the optional, more expensive measurements for this process and
+    its workers: a cProfile dump per stage and the tracemalloc peak.
+    """
+    os.environ[PROFILE_ENV] = "1" if profile else ""
+    os.environ[TRACE_MEMORY_ENV] = "1" if trace_memory else ""
+
+def instrument(func):
+    """
+    Decorator for pipeline stages: records wall time, CPU time, RSS (current,
+    change and process peak), optionally the tracemalloc peak, the rows of the
+    DataFrame arguments and the size of the result, as one JSON line in
+    logs/pipeline_metrics.jsonl. With profiling on, the outermost stage of a
+    call chain also writes a cProfile dump to logs/profiles/.
+    """
+    stage = f"{func.__module__.rsplit('.', 1)[-1]}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        global _depth
+        process = psutil.Process()
+        rss_before = process.memory_info().rss
+        trace = bool(os.environ.get(TRACE_MEMORY_ENV)) and not tracemalloc.is_tracing()
+        profiler = cProfile.Profile() if os.environ.get(PROFILE_ENV) and _depth == 0 else None
+        if trace:
+            tracemalloc.start()
+        if profiler:
+            profiler.enable()
+
+        record = {'stage': stage, 'input_rows': _input_rows(args, kwargs), 'status': "ok"}
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        _depth += 1
+        try:
+            result = func(*args, **kwargs)
+            record['output'] = _output_size(result)
+            return result
+        except Exception as exc:
+            record['status'] = f"error: {exc!r}"
+            raise
+        finally:
+            _depth -= 1
+            record['wall_s'] = round(time.perf_counter() - wall_start, 6)
+            record['cpu_s'] = round(time.process_time() - cpu_start, 6)
+            if profiler:
+                profiler.disable()
+                record['profile'] = _dump_profile(profiler, stage)
+            if trace:
+                record['tracemalloc_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 3)
+                tracemalloc.stop()
+            memory = process.memory_info()
+            record['rss_mb'] = round(memory.rss / 2 ** 20, 3)
+            record['rss_delta_mb'] = round((memory.rss - rss_before) / 2 ** 20, 3)
+            record['peak_rss_mb'] = _peak_rss_mb(memory)
+            write_record(record)
+
+    return wrapper
+
+def write_record(record, path=METRICS_PATH):
+    """Appends one metrics record (timestamp and pid added) as a JSON line."""
+    record = {'time': datetime.now(timezone.utc).isoformat(timespec="milliseconds"), 'pid': os.getpid(), **record}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # One short append per record: lines from parallel workers do not interleave
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+def read_metrics(path=METRICS_PATH):
+    """Loads the metrics file as a DataFrame (one row per instrumented call)."""
+    return pd.read_json(path, lines=True) if os.path.exists(path) else pd.DataFrame()
+
+def _input_rows(args, kwargs):
+    """Total rows of the DataFrame arguments (None when the stage takes no frame)."""
+    frames = [value for value in list(args) + list(kwargs.values()) if isinstance(value, pd.DataFrame)]
+    return sum(len(frame) for frame in frames) if frames else None
+
+def _output_size(result):
+    """A small description of a stage's return value."""
+    if isinstance(result, pd.DataFrame):
+        return {'rows': len(result), 'columns': result.shape[1], 'bytes': int(result.memory_usage(deep=False).sum())}
+    if isinstance(result, (dict, list, tuple)):
+        return {'items': len(result)}
+    if isinstance(result, (int, float, str)):
+        return {'value': result}
+    return None
+
+def _peak_rss_mb(memory):
+    """Peak resident memory of the process so far (Windows reports it directly, POSIX via getrusage)."""
+    if hasattr(memory, "peak_wset"):
+        return round(memory.peak_wset / 2 ** 20, 3)
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak / (2 ** 20 if os.uname().sysname == "Darwin" else 2 ** 10), 3)
+
+def _dump_profile(profiler, stage):
+    """Writes the cProfile stats of one stage call and returns the file path."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    path = os.path.join(PROFILE_DIR, f"{stage}-{os.getpid()}-{stamp}.prof")
+    profiler.dump_stats(path)
+    return path
@@ -0,0 +1,227 @@
+import glob
+import hashlib
+import importlib
+import importlib.util
+import inspect
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+import pandas as pd
+from SRC import clean_cache
+from SRC import report_sink
+from SRC import storage
+
+MANIFEST_PATH = "data/cache/stage_manifest.json"
+LOG_PATH = "logs/pipeline.log"
+# SRC imports found in module or function source, including the lazy ones inside functions
+SRC_IMPORT = re.compile(r"^\s*(?:from SRC import ([\w, ]+)|import SRC\.(\w+))", re.MULTILINE)
+
+def stage(name, run, inputs=(), outputs=(), code=(), params=None, imports=()):
+    """
+    Declares one pipeline stage.
+    run(logger, **params) is called to produce the outputs (paths or glob
+    patterns) from the inputs (paths). A stage depends on the stages whose
+    declared outputs it lists as inputs; code lists the modules (by name, so
+    declaring a stage never imports them) and helper functions whose source is
+    part of its fingerprint, together with every SRC module they import (see
+    code_closure), and imports the (heavy) modules it loads lazily when it runs.
+    """
+    return {'name': name, 'run': run, 'inputs': list(inputs), 'outputs': list(outputs),
+            'code': list(code), 'params': dict(params or {}), 'imports': list(imports)}
+
+def run_stages(stages, logger, max_workers=None, manifest_path=MANIFEST_PATH, force=False):
+    """
+    Runs a stage DAG: every stage starts as soon as its dependencies have finished,
+    independent stages run in parallel worker processes, and a stage is skipped
+    when its fingerprint (input contents, code, params) matches the one recorded
+    for its last run and its outputs still exist.
+    Returns a summary frame with the status and duration of every stage.
+    """
+    by_name = {s['name']: s for s in stages}
+    deps = stage_dependencies(stages)
+    manifest = _load_manifest(manifest_path)
+    results, running = {}, {}
+    workers = max_workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) if workers > 1 else None
+
+    try:
+        while len(results) < len(stages):
+            # Launch (or skip) everything whose dependencies are settled
+            for name, s in by_name.items():
+                if name in results or name in running or not deps[name] <= set(results):
+                    continue
+                if any(results[dep]['Status'] in ("failed", "blocked") for dep in deps[name]):
+                    results[name] = _summary(name, "blocked")
+                    continue
+                fingerprint = stage_fingerprint(s)
+                if not force and _is_fresh(manifest.get(name), fingerprint):
+                    logger.info(f"Stage '{name}' is up to date, skipped.")
+                    results[name] = _summary(name, "skipped")
+                    continue
+                logger.info(f"Stage '{name}' started.")
+                task = (s['run'], s['params'], name)
+                future = pool.submit(_run_stage, task) if pool else _completed(_run_stage(task))
+                running[name] = (future, fingerprint)
+
+            if not running:
+                continue
+            done, _ = wait([future for future, _ in running.values()], return_when=FIRST_COMPLETED)
+            for name in [n for n, (future, _) in running.items() if future in done]:
+                future, fingerprint = running.pop(name)
+                status, seconds, error = future.result()
+                if status == "ok":
+                    manifest[name] = {'fingerprint': fingerprint, 'outputs': _output_digests(by_name[name]['outputs'])}
+                    _save_manifest(manifest, manifest_path)
+                    logger.info(f"Stage '{name}' finished in {seconds:.2f}s.")
+                else:
+                    manifest.pop(name, None)
+                    logger.error(f"Stage '{name}' failed: {error}")
+                results[name] = _summary(name, status, seconds)
+    finally:
+        if pool:
+            pool.shutdown()
+
+    return pd.DataFrame([results[s['name']] for s in stages])
+
+def measure_imports(stages):
+    """
+    Imports the modules declared by the stages one by one and returns
+    (module, stage, seconds) rows. Each time is the first-import cost on top of
+    what is already loaded, so a module pulled in earlier shows up as ~0.
+    """
+    rows = []
+    for s in stages:
+        for name in s['imports']:
+            start = time.perf_counter()
+            importlib.import_module(name)
+            rows.append((name, s['name'], time.perf_counter() - start))
+    return rows
+
+def stage_dependencies(stages):
+    """
+    Maps every stage to the set of stages producing its inputs.
+    Raises ValueError for duplicate stage names or cycles.
+    """
+    names = [s['name'] for s in stages]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate stage names: {names}")
+    producers = {}
+    for s in stages:
+        for output in s['outputs']:
+            producers[output] = s['name']
+    deps = {s['name']: {producers[path] for path in s['inputs'] if path in producers} - {s['name']}
+            for s in stages}
+
+    # Kahn's algorithm: a DAG can be emptied by repeatedly removing stages without open dependencies
+    remaining = {name: set(d) for name, d in deps.items()}
+    while remaining:
+        ready = [name for name, d in remaining.items() if not d]
+        if not ready:
+            raise ValueError(f"Stage dependencies form a cycle: {sorted(remaining)}")
+        for name in ready:
+            del remaining[name]
+        for d in remaining.values():
+            d.difference_update(ready)
+    return deps
+
+def stage_fingerprint(s):
+    """Hashes a stage's input file contents, code and params."""
+    config = {
+        'inputs': {path: clean_cache.file_digest(path) if os.path.exists(path) else None for path in s['inputs']},
+        'code': [_source_digest(obj) for obj in code_closure([s['run']] + s['code'])],
+        'params': repr(sorted(s['params'].items())),
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+def code_closure(code):
+    """
+    The given modules / functions plus every SRC module they import, directly
+    or transitively. Sources are read from disk, so nothing is imported.
+    """
+    closure, pending = [], list(code)
+    while pending:
+        obj = pending.pop(0)
+        if obj in closure:
+            continue
+        closure.append(obj)
+        for names, module in SRC_IMPORT.findall(_source(obj)):
+            names = names.split(",") if names else [module]
+            pending += [f"SRC.{name.strip()}" for name in names if name.strip()]
+    return closure
+
+def _source(obj):
+    """Source text of a function, or of a module given by name (read from disk without importing)."""
+    if isinstance(obj, str):
+        with open(importlib.util.find_spec(obj).origin, encoding="utf-8") as f:
+            return f.read()
+    return inspect.getsource(obj)
+
+def _source_digest(obj):
+    """SHA-256 of a function's or module's source."""
+    return hashlib.sha256(_source(obj).encode()).hexdigest()
+
+def _is_fresh(record, fingerprint):
+    """
+    True when the last successful run had this fingerprint and its outputs are
+    still exactly as it left them (a file rewritten outside the DAG, e.g. by the
+    incremental command, makes the stage stale).
+    """
+    if record is None or record['fingerprint'] != fingerprint or not isinstance(record['outputs'], dict):
+        return False  # Manifests from before output digests were recorded are re-run once
+    return all(os.path.exists(path) and clean_cache.file_digest(path) == digest
+               for path, digest in record['outputs'].items())
+
+def _output_digests(outputs):
+    """Content digest of every output file (glob patterns resolved)."""
+    return {path: clean_cache.file_digest(path) for path in _expand(outputs) if os.path.exists(path)}
+
+def _expand(outputs):
+    """Resolves output glob patterns to the files that exist."""
+    paths = []
+    for pattern in outputs:
+        paths += sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+    return paths
+
+def _run_stage(task):
+    """Executes one stage (in a worker process or inline) and reports (status, seconds, error)."""
+    run, params, name = task
+    start = time.perf_counter()
+    try:
+        run(logging.getLogger(name), **params)
+        # Outputs must be on disk before the stage is recorded as done
+        report_sink.flush()
+    except Exception as exc:  # Reported to the executor, which blocks the dependent stages
+        return "failed", time.perf_counter() - start, repr(exc)
+    return "ok", time.perf_counter() - start, None
+
+def _init_worker():
+    """Pool initializer: workers started without the parent's logging config log to the same file."""
+    if not logging.getLogger().handlers:
+        os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s',
+                            handlers=[logging.FileHandler(LOG_PATH, encoding='utf-8')])
+
+def _completed(result):
+    """Wraps an inline result in a finished future so both paths share the wait loop."""
+    future = Future()
+    future.set_result(result)
+    return future
+
+def _summary(name, status, seconds=0.0):
+    return {'Stage': name, 'Status': status, 'Seconds': round(seconds, 3)}
+
+def _load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def _save_manifest(manifest, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = storage.temp_path(path)
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
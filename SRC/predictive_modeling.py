@@ -1,63 +1,213 @@
-import pandas as pd
+import json
 import os
+import warnings
+import numpy as np
+import pandas as pd
+from SRC import analysis_context
+from SRC import data_cleaning
+from SRC import resampling
+from SRC import report_sink
+from SRC import instrumentation
+
+# Target variables to predict
+RISK_TARGETS = {
+    'Depression_Score': 'Depression',
+    'Anxiety_Score': 'Anxiety',
+    'Stress_Level': 'Stress'
+}
+# Scores above this value (4 or 5) count as 'High Risk'
+HIGH_RISK_THRESHOLD = 3
+# Lifestyle and academic features available for every student after pre_process
+RISK_FEATURES = ['Age', 'CGPA', 'Semester_Credit_Load', 'Financial_Stress', 'Is_STEM'] + list(data_cleaning.ORDINAL_ENCODINGS)
+MODEL_PATH = "models/risk_model.json"
 
-def run_risk_prediction_pipeline(df, logger):
+@instrumentation.instrument
+def run_risk_prediction_pipeline(df, logger, output_dir="reports/tables", n_resamples=0, seed=None, context=None):
     """
     Main pipeline to execute mental health risk prediction analysis.
     Predicts the likelihood of high distress (score 4-5) per major.
+    With n_resamples > 0 each probability gets a 95% bootstrap interval.
     """
     logger.info("Starting Risk Prediction Modeling.")
     
-    # Target variables to predict
-    targets = {
-        'Depression_Score': 'Depression',
-        'Anxiety_Score': 'Anxiety',
-        'Stress_Level': 'Stress'
-    }
-    
-    # Initializing the report header
-    report = "STUDENT MENTAL HEALTH: RISK PREDICTION REPORT\n"
-    report += "="*50 + "\n"
-    report += "Criteria: 'High Risk' defined as a clinical score of 4 or 5.\n\n"
+    # Stage 1: compute the high-risk rates of every target at once (or reuse them from the analysis context)
+    risk_table = shared_risk_table(df, RISK_TARGETS, context=context)
 
-    # Processing each target variable
-    for col, label in targets.items():
-        report += _calculate_target_risk(df, col, label)
-        
-    _save_prediction_report(report, logger)
+    # Stage 2: render the report, streaming it line by line to disk
+    write_risk_report(risk_table, logger, output_dir, n_resamples, seed)
+
+def write_risk_report(risk_table, logger, output_dir="reports/tables", n_resamples=0, seed=None):
+    """Renders a risk table from compute_risk_table into risk_prediction_report.txt."""
+    lines = _render_risk_report(risk_table, RISK_TARGETS, n_resamples, seed)
+    _save_prediction_report(lines, logger, output_dir)
+
+def compute_risk_table(df, targets=RISK_TARGETS, group_col='Course'):
+    """
+    Computes the high-risk count, group size and rate (%) of every target per
+    group with a single groupby over boolean indicators (no frame copies).
+    Returns a frame indexed by group with columns (target, statistic).
+    """
+    # Only the boolean indicators are materialized, never the full frame
+    is_high_risk = pd.DataFrame({col: df[col].to_numpy() > HIGH_RISK_THRESHOLD for col in targets}, index=df.index)
+    table = is_high_risk.groupby(df[group_col], observed=True, sort=True).agg(['sum', 'count'])
+
+    for col in targets:
+        table[(col, 'rate')] = table[(col, 'sum')] / table[(col, 'count')] * 100
+    return table
 
-def _calculate_target_risk(df, column, label):
+def shared_risk_table(df, targets=RISK_TARGETS, group_col='Course', context=None):
+    """compute_risk_table, memoized in the analysis context (if any) for the stages that follow."""
+    return analysis_context.memoize(context, ('risk_table', group_col, tuple(targets)),
+                                    lambda: compute_risk_table(df, targets, group_col), df)
+
+def _calculate_target_risk(df, column, label, n_resamples=0, seed=None, context=None):
     """
     Calculates the empirical probability of high risk for a specific target.
     Returns a formatted string section for the report.
+    With an analysis context, the table of all RISK_TARGETS is computed once and reused.
     """
-    # Create a binary indicator for High Risk (>3)
-    df_temp = df.copy()
-    df_temp['Is_High_Risk'] = (df_temp[column] > 3).astype(int)
+    targets = RISK_TARGETS if context is not None and column in RISK_TARGETS else {column: label}
+    risk_table = shared_risk_table(df, targets, context=context)
+    return "".join(_risk_section_lines(risk_table, column, label, n_resamples, seed))
+
+def _render_risk_report(risk_table, targets, n_resamples=0, seed=None):
+    """Yields the lines of the full report: header, then one section per target."""
+    yield "STUDENT MENTAL HEALTH: RISK PREDICTION REPORT\n"
+    yield "="*50 + "\n"
+    yield "Criteria: 'High Risk' defined as a clinical score of 4 or 5.\n"
+    if n_resamples:
+        yield f"Intervals: 95% bootstrap percentile CI ({n_resamples} replicates).\n"
+    yield "\n"
+
+    for col, label in targets.items():
+        yield from _risk_section_lines(risk_table, col, label, n_resamples, seed)
+
+def _risk_section_lines(risk_table, column, label, n_resamples=0, seed=None):
+    """Yields the lines of one target's section, majors sorted by descending risk."""
+    risk_stats = risk_table[(column, 'rate')].sort_values(ascending=False)
     
-    # Group by major and calculate percentage (Probability)
-    risk_stats = df_temp.groupby('Course')['Is_High_Risk'].mean() * 100
-    risk_stats = risk_stats.sort_values(ascending=False)
+    # Optional bootstrap intervals, drawn for all majors in one call
+    if n_resamples:
+        counts = risk_table[column].loc[risk_stats.index]
+        low, high = resampling.bootstrap_proportions(counts['sum'], counts['count'], n_resamples, seed=seed)
     
     # Formatting the visual table section
-    section = f"--- PREDICTION PROFILE: {label.upper()} ---\n"
-    section += f"{'Academic Major':<25} | {'Risk Chance (%)':<15}\n"
-    section += "-"*45 + "\n"
+    yield f"--- PREDICTION PROFILE: {label.upper()} ---\n"
+    if n_resamples:
+        yield f"{'Academic Major':<25} | {'Risk Chance (%)':<15} | 95% CI (%)\n"
+        yield "-"*63 + "\n"
+    else:
+        yield f"{'Academic Major':<25} | {'Risk Chance (%)':<15}\n"
+        yield "-"*45 + "\n"
     
-    for major, prob in risk_stats.items():
-        section += f"{major:<25} | {prob:>12.1f}%\n"
+    for i, (major, prob) in enumerate(risk_stats.items()):
+        if n_resamples:
+            yield f"{major:<25} | {prob:>12.1f}% | {low[i] * 100:>5.1f} - {high[i] * 100:>5.1f}\n"
+        else:
+            yield f"{major:<25} | {prob:>12.1f}%\n"
     
-    return section + "\n"
+    yield "\n"
 
-def _save_prediction_report(content, logger):
+def _save_prediction_report(lines, logger, output_dir="reports/tables"):
     """
-    Saves the final predictive analysis to a text file.
-    Ensures the output directory exists.
+    Saves the final predictive analysis to a text file through the report sink
+    (which also creates the output directory).
     """
-    output_path = "reports/tables/risk_prediction_report.txt"
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
-    with open(output_path, "w") as f:
-        f.write(content)
+    output_path = os.path.join(output_dir, "risk_prediction_report.txt")
+    report_sink.write_text(lines, output_path)
         
-    logger.info(f"Predictive Risk Report saved to: {output_path}")
\ No newline at end of file
+    logger.info(f"Predictive Risk Report saved to: {output_path}")
+
+@instrumentation.instrument
+def fit_risk_model(df, logger, features=RISK_FEATURES, model_path=MODEL_PATH, regularization=1.0):
+    """
+    Trains one logistic regression per target (high risk = score 4-5) on the
+    encoded lifestyle features plus course indicators, and saves the
+    coefficients as a JSON artifact.
+    Returns the model dictionary used by predict_proba.
+    """
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.metrics import roc_auc_score
+
+    logger.info("Fitting risk prediction model.")
+    courses = sorted(df['Course'].dropna().unique())
+    X = _risk_feature_matrix(df, features, courses)
+    # Unknown or missing ordinal labels are NaN: impute the training means, as predict_proba does
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)  # All-missing columns get mean 0 below
+        mean, scale = np.nanmean(X, axis=0), np.nanstd(X, axis=0)
+    mean, scale = np.nan_to_num(mean), np.nan_to_num(scale)
+    scale[scale == 0] = 1.0
+    X = np.where(np.isnan(X), mean, X)
+    X_std = (X - mean) / scale
+
+    weights, intercepts = [], []
+    n_columns = X.shape[1]
+    for col, label in RISK_TARGETS.items():
+        y = (df[col] > HIGH_RISK_THRESHOLD).to_numpy()
+        if y.all() or not y.any():
+            # A single class cannot be separated: fall back to the (clipped) base rate
+            rate = np.clip(y.mean(), 1e-6, 1 - 1e-6)
+            weights.append(np.zeros(n_columns))
+            intercepts.append(np.log(rate / (1 - rate)))
+            continue
+        clf = LogisticRegression(C=regularization, max_iter=1000).fit(X_std, y)
+        weights.append(clf.coef_[0])
+        intercepts.append(clf.intercept_[0])
+        logger.info(f"Risk model for {label}: in-sample AUC {roc_auc_score(y, clf.decision_function(X_std)):.3f}")
+
+    # Fold the standardization into the coefficients so scoring is a single X @ W + b
+    weights = np.column_stack(weights) / scale[:, None]
+    intercepts = np.array(intercepts) - mean @ weights
+    model = {
+        'features': list(features),
+        'courses': courses,
+        'targets': list(RISK_TARGETS),
+        'threshold': HIGH_RISK_THRESHOLD,
+        'feature_means': mean.tolist(),
+        'weights': weights.tolist(),
+        'intercepts': intercepts.tolist()
+    }
+    save_risk_model(model, model_path)
+    logger.info(f"Risk model saved to: {model_path}")
+    return model
+
+def save_risk_model(model, model_path=MODEL_PATH):
+    """
+    Writes the model dictionary to a JSON file through the report sink, so a
+    stage that dies mid-write never leaves a truncated artifact behind.
+    """
+    report_sink.write_text(json.dumps(model, indent=2), model_path)
+
+def load_risk_model(model_path=MODEL_PATH):
+    """Reads a model saved by fit_risk_model."""
+    with open(model_path) as f:
+        return json.load(f)
+
+def predict_proba(model, df):
+    """
+    Scores every row of df with the saved model in one matrix product.
+    Accepts cleaned frames or raw survey rows (ordinal labels are encoded and
+    Is_STEM is derived when missing). Missing values are imputed with the
+    training means. Returns one probability column per target.
+    """
+    X = _risk_feature_matrix(df, model['features'], model['courses'])
+    X = np.where(np.isnan(X), np.asarray(model['feature_means']), X)
+    logits = X @ np.asarray(model['weights']) + np.asarray(model['intercepts'])
+    columns = [f"P_High_{RISK_TARGETS.get(col, col)}" for col in model['targets']]
+    return pd.DataFrame(1 / (1 + np.exp(-logits)), index=df.index, columns=columns)
+
+def _risk_feature_matrix(df, features, courses):
+    """
+    Builds the float feature matrix (features, then one indicator per course),
+    encoding raw survey columns only when needed.
+    """
+    frame = df[[col for col in features if col in df.columns]]
+    if 'Is_STEM' in features and 'Is_STEM' not in frame.columns:
+        frame = frame.assign(Is_STEM=df['Course'].isin(data_cleaning.STEM_COURSES).astype(int))
+    raw_ordinals = {col: levels for col, levels in data_cleaning.ORDINAL_ENCODINGS.items()
+                    if col in frame.columns and not pd.api.types.is_numeric_dtype(frame[col])}
+    if raw_ordinals:
+        frame = data_cleaning.encode_ordinals(frame.copy(), raw_ordinals)
+    course_indicators = df['Course'].to_numpy()[:, None] == np.asarray(courses, dtype=object)
+    return np.hstack([frame[features].to_numpy(dtype=float), course_indicators])
@@ -0,0 +1,123 @@
+import atexit
+import os
+import queue
+import threading
+import zipfile
+from SRC import storage
+
+REPORT_ROOTS = ["reports/tables", "reports/figures"]
+BUNDLE_DIR = "reports/bundles"
+# The setting lives in the environment so worker processes of the stage pools inherit it
+ASYNC_ENV = "REPORT_SINK_ASYNC"
+
+# Writer state of this process (a forked child starts its own writer, see _writer_queue)
+_queue = None
+_owner_pid = None
+_errors = []
+_made_dirs = set()
+
+def configure(async_writes=False):
+    """
+    Turns background report writing on or off for this process and its
+    workers. Off (the default), every report is written before the call returns.
+    """
+    os.environ[ASYNC_ENV] = "1" if async_writes else ""
+
+def submit(path, write):
+    """
+    Queues one output file: write(tmp_path) serializes it to a temporary file
+    next to path, which then atomically replaces path, so readers never see a
+    half-written report. With asynchronous writes on, this happens on a
+    background thread and errors surface at flush(). Returns path.
+    """
+    if os.environ.get(ASYNC_ENV):
+        _writer_queue().put((path, write))
+    else:
+        _write(path, write)
+    return path
+
+def write_table(df, path, **kwargs):
+    """Queues a frame as CSV (kwargs go to to_csv). The frame must not be modified afterwards."""
+    return submit(path, lambda tmp_path: df.to_csv(tmp_path, **kwargs))
+
+def write_text(lines, path):
+    """Queues a text report given as a string or an iterable of lines."""
+    if os.environ.get(ASYNC_ENV) and not isinstance(lines, str):
+        # Lines may be produced lazily: render them here, not on the writer thread
+        lines = "".join(lines)
+
+    def write(tmp_path):
+        with open(tmp_path, "w") as f:
+            f.writelines(lines)
+    return submit(path, write)
+
+def write_figure(fig, path, **kwargs):
+    """Queues a matplotlib Figure (kwargs go to savefig); the format follows the file extension."""
+    fmt = os.path.splitext(path)[1].lstrip(".") or "png"
+    return submit(path, lambda tmp_path: fig.savefig(tmp_path, format=fmt, **kwargs))
+
+def write_bundle(bundle_path, roots=REPORT_ROOTS):
+    """
+    Queues a zip archive of every file under the report roots, as one
+    consolidated output of a run. It is built after the reports queued before it.
+    """
+    def write(tmp_path):
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+            for path in _report_files(roots):
+                if os.path.abspath(path) != os.path.abspath(bundle_path):
+                    bundle.write(path, os.path.relpath(path))
+    return submit(bundle_path, write)
+
+def flush():
+    """Blocks until every queued report is on disk; re-raises the first write error."""
+    if _queue is not None and _owner_pid == os.getpid():
+        _queue.join()
+    if _errors:
+        path, exc = _errors[0]
+        _errors.clear()
+        raise OSError(f"Writing {path} failed: {exc!r}") from exc
+
+def _writer_queue():
+    """The queue of this process's writer thread, started on first use."""
+    global _queue, _owner_pid
+    # A forked worker inherits the queue object but not the thread draining it
+    if _queue is None or _owner_pid != os.getpid():
+        _queue, _owner_pid = queue.Queue(), os.getpid()
+        _errors.clear()
+        threading.Thread(target=_drain, args=(_queue,), name="report-sink", daemon=True).start()
+        atexit.register(flush)
+    return _queue
+
+def _drain(jobs):
+    """Writer thread loop: writes the queued reports one by one, collecting errors."""
+    while True:
+        path, write = jobs.get()
+        try:
+            _write(path, write)
+        except Exception as exc:  # Reported by the next flush()
+            _errors.append((path, exc))
+        finally:
+            jobs.task_done()
+
+def _write(path, write):
+    """Writes one report through a temporary file; each directory is created once per process."""
+    directory = os.path.abspath(os.path.dirname(path) or ".")
+    if directory not in _made_dirs:
+        os.makedirs(directory, exist_ok=True)
+        _made_dirs.add(directory)
+    tmp_path = storage.temp_path(path)  # Unique per write: parallel writers never touch each other's file
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _report_files(roots):
+    """Files under the report roots, in a stable order, without temporary files."""
+    paths = []
+    for root in roots:
+        for folder, _, names in os.walk(root):
+            paths += [os.path.join(folder, name) for name in names if not name.endswith(storage.TEMP_SUFFIX)]
+    return sorted(paths)
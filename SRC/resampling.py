@@ -0,0 +1,115 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+DEFAULT_RESAMPLES = 10_000
+# Upper bound on the cells of one replicate matrix, which keeps a batch at ~32 MB
+BATCH_CELLS = 4_000_000
+
+def bootstrap_cohen_d(group1, group2, n_resamples=DEFAULT_RESAMPLES, confidence=0.95, seed=None, max_workers=1):
+    """
+    Percentile bootstrap confidence interval for Cohen's d.
+    Each group is resampled with replacement; returns (low, high).
+    """
+    values1, counts1 = _compress(group1)
+    values2, counts2 = _compress(group2)
+    replicates = _run_batches(_bootstrap_d_batch, (values1, counts1, values2, counts2),
+                              len(values1) + len(values2), n_resamples, seed, max_workers)
+    return _percentile_interval(replicates, confidence)
+
+def permutation_p_value(group1, group2, n_resamples=DEFAULT_RESAMPLES, seed=None, max_workers=1):
+    """
+    Two-sided permutation test for a difference in means between two groups.
+    With the pooled sample fixed, the pooled-variance t-statistic is monotone in
+    the mean difference, so this is also the permutation p-value of the t-test.
+    """
+    values1, counts1 = _compress(group1)
+    values2, counts2 = _compress(group2)
+    values, inverse = np.unique(np.concatenate([values1, values2]), return_inverse=True)
+    pooled = np.bincount(inverse, weights=np.concatenate([counts1, counts2]).astype(float)).astype(np.int64)
+
+    n1, n2 = counts1.sum(), counts2.sum()
+    observed = abs(values1 @ counts1 / n1 - values2 @ counts2 / n2)
+    replicates = _run_batches(_permutation_diff_batch, (values, pooled, n1), len(values),
+                              n_resamples, seed, max_workers)
+    # The +1 terms count the observed labelling itself, so p is never exactly zero
+    extreme = np.count_nonzero(np.abs(replicates) >= observed - 1e-12)
+    return (extreme + 1) / (n_resamples + 1)
+
+def bootstrap_proportions(successes, totals, n_resamples=DEFAULT_RESAMPLES, confidence=0.95, seed=None):
+    """
+    Percentile bootstrap intervals for many proportions at once (e.g. high-risk
+    rate per course). The bootstrap distribution of a binary mean is binomial,
+    so all groups x replicates are drawn in one call. Returns (low, high) arrays.
+    """
+    successes = np.asarray(successes, dtype=float)
+    totals = np.asarray(totals, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    rates = np.divide(successes, totals, out=np.zeros_like(successes), where=totals > 0)
+    draws = rng.binomial(totals[:, None], rates[:, None], size=(len(totals), n_resamples))
+    replicates = draws / np.maximum(totals, 1)[:, None]
+    return _percentile_interval(replicates, confidence, axis=1)
+
+def _compress(values):
+    """
+    Reduces a sample to its distinct values and their counts. Survey scores take
+    a handful of values, so resampling count vectors is far cheaper than
+    resampling individual rows, while giving the same bootstrap distribution.
+    """
+    values = np.asarray(values, dtype=float)
+    return np.unique(values[~np.isnan(values)], return_counts=True)
+
+def _run_batches(batch_fn, data, width, n_resamples, seed, max_workers):
+    """
+    Splits n_resamples into batches of at most BATCH_CELLS cells and evaluates
+    them serially or in a process pool. Every batch gets its own child seed, so
+    results do not depend on the number of workers.
+    """
+    batch_size = max(1, BATCH_CELLS // max(width, 1))
+    sizes = [min(batch_size, n_resamples - start) for start in range(0, n_resamples, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(data, size, child) for size, child in zip(sizes, seeds)]
+
+    if max_workers == 1 or len(tasks) == 1:
+        results = [batch_fn(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(batch_fn, tasks))
+    return np.concatenate(results) if results else np.empty(0)
+
+def _bootstrap_d_batch(task):
+    """Draws one batch of bootstrap count matrices and returns Cohen's d per replicate."""
+    (values1, counts1, values2, counts2), size, seed = task
+    rng = np.random.default_rng(seed)
+    n1, n2 = counts1.sum(), counts2.sum()
+
+    # Row r holds how often each distinct value was drawn in replicate r
+    weights1 = rng.multinomial(n1, counts1 / n1, size=size)
+    weights2 = rng.multinomial(n2, counts2 / n2, size=size)
+
+    mean1, var1 = _weighted_moments(values1, weights1, n1)
+    mean2, var2 = _weighted_moments(values2, weights2, n2)
+    pooled_var = ((n1 - 1) * var1 + (n2 - 1) * var2) / (n1 + n2 - 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (mean1 - mean2) / np.sqrt(pooled_var)
+
+def _permutation_diff_batch(task):
+    """Draws one batch of label permutations and returns the mean difference per replicate."""
+    (values, pooled, n1), size, seed = task
+    rng = np.random.default_rng(seed)
+    n2 = pooled.sum() - n1
+
+    # Group 1 of a random relabelling is a draw without replacement from the pooled sample
+    weights1 = rng.multivariate_hypergeometric(pooled, n1, size=size)
+    sum1 = weights1 @ values
+    return sum1 / n1 - (pooled @ values - sum1) / n2
+
+def _weighted_moments(values, weights, n):
+    """Mean and sample variance of every replicate row from its value counts."""
+    mean = weights @ values / n
+    var = (weights @ values ** 2 - n * mean ** 2) / (n - 1)
+    return mean, var
+
+def _percentile_interval(replicates, confidence, axis=None):
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.nanpercentile(replicates, [tail, 100 - tail], axis=axis)
+    return low, high
@@ -4,8 +4,11 @@ import logging
 import os
 import sys
 import warnings
-from scipy import stats
-from statsmodels.stats.multicomp import pairwise_tukeyhsd
+from functools import lru_cache
+from SRC import resampling
+from SRC import analysis_context
+from SRC import report_sink
+from SRC import instrumentation
 
 def setup_environment():
     """
@@ -38,68 +41,231 @@ def calculate_cohen_d(group1, group2):
     Calculates Cohen's d to measure the effect size (magnitude of difference)
     between two independent samples.
     """
-    # Get sample sizes and variances
-    n1, n2 = len(group1), len(group2)
-    var1, var2 = np.var(group1, ddof=1), np.var(group2, ddof=1)
-    
-    # Calculate pooled standard deviation
-    pooled_std = np.sqrt(((n1 - 1) * var1 + (n2 - 1) * var2) / (n1 + n2 - 2))
-    
-    # Return the d-value (Difference of means divided by pooled std)
-    return (np.mean(group1) - np.mean(group2)) / pooled_std
+    group1, group2 = np.asarray(group1, dtype=float), np.asarray(group2, dtype=float)
+    _, _, d_val = two_sample_tests(len(group1), group1.mean(), group1.var(ddof=1),
+                                   len(group2), group2.mean(), group2.var(ddof=1))
+    return d_val
+
+def two_sample_tests(n1, mean1, var1, n2, mean2, var2):
+    """
+    Independent Samples T-Test (pooled variance) and Cohen's d from group moments.
+    Every argument may be an array with one entry per metric; returns (t, p, d).
+    """
+    from scipy import stats  # Imported on first use: scipy.stats dominates this module's import time
+
+    # Pooled variance is shared by the t-statistic and the effect size
+    dof = n1 + n2 - 2
+    pooled_var = ((n1 - 1) * var1 + (n2 - 1) * var2) / dof
+    mean_diff = mean1 - mean2
+
+    t_stat = mean_diff / np.sqrt(pooled_var * (1 / n1 + 1 / n2))
+    p_val = 2 * stats.t.sf(np.abs(t_stat), dof)
+    d_val = mean_diff / np.sqrt(pooled_var)
+    return t_stat, p_val, d_val
+
+def compare_groups(df, variables, group_col='Is_STEM', groups=(1, 0)):
+    """
+    Runs the two-group comparison (STEM vs Non-STEM by default) for all variables
+    from a single split and one set of per-group moments.
+    Returns a frame indexed by variable with the t-statistic, p-value and Cohen's d.
+    """
+    return compare_moments(group_moments(df, group_col, variables), variables, groups)
+
+def compare_moments(moments, variables, groups=(1, 0)):
+    """Two-group comparison from a group_moments frame (or moments kept elsewhere)."""
+    moments = moments.reindex(list(groups))
+    n = moments['count']
+    mean = moments['sum'] / n
+    var = (moments['sumsq'] - n * mean ** 2) / (n - 1)
 
-def run_t_tests(df, variables, logger):
+    first, second = groups
+    t_stat, p_val, d_val = two_sample_tests(n.loc[first], mean.loc[first], var.loc[first],
+                                            n.loc[second], mean.loc[second], var.loc[second])
+    return pd.DataFrame({'T-Statistic': t_stat, 'P-Value': p_val, 'Cohen_d': d_val}, index=variables)
+
+@instrumentation.instrument
+def run_t_tests(df, variables, logger, output_dir="reports/tables", n_resamples=0, seed=None, context=None):
     """
     Performs Independent Samples T-Tests to compare STEM and Non-STEM students.
     Saves a summary CSV with statistics, p-values, and effect sizes.
+    With n_resamples > 0 it adds a bootstrap CI for Cohen's d and a permutation p-value.
+    With an analysis context the group moments and the STEM split are shared with other stages.
     """
     logger.info("--- STARTING T-TEST ANALYSIS (STEM vs Non-STEM) ---")
+    comparison = compare_moments(shared_moments(df, 'Is_STEM', variables, context), variables)
     t_results = []
     
     for var in variables:
-        # Split data into groups based on the 'Is_STEM' flag
-        stem = df[df['Is_STEM'] == 1][var]
-        non_stem = df[df['Is_STEM'] == 0][var]
-        
-        # Calculate t-statistic and p-value
-        t_stat, p_val = stats.ttest_ind(stem, non_stem)
-        d_val = calculate_cohen_d(stem, non_stem)
-        
         # Append results to the summary list
-        t_results.append({
-            'Variable': var,
-            'T-Statistic': round(t_stat, 3),
-            'P-Value': round(p_val, 4),
-            'Cohen_d': round(d_val, 3),
-            'Significant': p_val < 0.05
-        })
+        result = _t_test_record(comparison, var)
+
+        if n_resamples:
+            # Resampling-based uncertainty for the same STEM / Non-STEM split
+            values = df[var].to_numpy(dtype=np.float64)  # Scores are stored as int8
+            split = analysis_context.group_indices(context, 'Is_STEM', df)
+            stem, non_stem = values[split.get(1, [])], values[split.get(0, [])]
+            if len(stem) and len(non_stem):
+                d_low, d_high = resampling.bootstrap_cohen_d(stem, non_stem, n_resamples, seed=seed)
+                perm_p = resampling.permutation_p_value(stem, non_stem, n_resamples, seed=seed)
+            else:
+                # Nothing to resample from: report the intervals as missing, like the moment-based statistics
+                logger.warning(f"No STEM or no Non-STEM students: {var} resampling columns left empty.")
+                d_low = d_high = perm_p = np.nan
+            result['Cohen_d_CI_Low'] = round(d_low, 3)
+            result['Cohen_d_CI_High'] = round(d_high, 3)
+            result['Permutation_P'] = round(perm_p, 4)
+        t_results.append(result)
     
     # Convert list to DataFrame and save to the tables folder
-    pd.DataFrame(t_results).to_csv("reports/tables/t_test_results.csv", index=False)
+    save_t_test_table(t_results, logger, output_dir)
+
+def save_t_test_table(t_results, logger, output_dir="reports/tables", filename="t_test_results.csv"):
+    """Writes the T-Test summary rows to output_dir/filename (t_test_results.csv by default)."""
+    report_sink.write_table(pd.DataFrame(t_results), os.path.join(output_dir, filename), index=False)
     logger.info("T-Test summary saved successfully.")
 
-def run_anova_and_tukey(df, variables, logger):
+def _t_test_record(comparison, var):
+    """One rounded row of the T-Test summary for a variable of compare_groups."""
+    t_stat, p_val, d_val = comparison.loc[var, ['T-Statistic', 'P-Value', 'Cohen_d']]
+    return {
+        'Variable': var,
+        'T-Statistic': round(t_stat, 3),
+        'P-Value': round(p_val, 4),
+        'Cohen_d': round(d_val, 3),
+        'Significant': p_val < 0.05
+    }
+
+def group_moments(df, group_col, variables):
+    """
+    Computes the sufficient statistics (count, sum, sum of squares) of every
+    variable per group in a single groupby pass.
+    Returns a frame indexed by group with columns (statistic, variable).
+    """
+    values = df[variables].astype(np.float64)
+    valid = values.notna()
+    values = values.where(valid, 0.0)
+
+    stacked = pd.concat({'count': valid.astype(np.float64), 'sum': values, 'sumsq': values ** 2}, axis=1)
+    return stacked.groupby(df[group_col], observed=True, sort=True).sum()
+
+def shared_moments(df, group_col, variables, context=None):
+    """group_moments, memoized in the analysis context (if any) for the stages that follow."""
+    return analysis_context.memoize(context, ('moments', group_col, tuple(variables)),
+                                    lambda: group_moments(df, group_col, variables), df)
+
+def one_way_anova(moments):
+    """
+    One-Way ANOVA for every variable from the group moments of group_moments.
+    Returns a frame indexed by variable with the F-statistic and p-value.
+    """
+    from scipy import stats
+
+    n, sums, sumsq = moments['count'], moments['sum'], moments['sumsq']
+    n_total = n.sum()
+    n_groups = (n > 0).sum()
+
+    # Between/within sums of squares, written in terms of sums and sums of squares
+    weighted = (sums ** 2 / n).sum()
+    ss_between = weighted - sums.sum() ** 2 / n_total
+    ss_within = sumsq.sum() - weighted
+    df_between, df_within = n_groups - 1, n_total - n_groups
+
+    f_stat = (ss_between / df_between) / (ss_within / df_within)
+    return pd.DataFrame({
+        'F-Statistic': f_stat,
+        'P-Value': stats.f.sf(f_stat, df_between, df_within)
+    })
+
+def tukey_hsd(moments, variable, alpha=0.05, significant_only=False):
+    """
+    Tukey HSD post-hoc test (Tukey-Kramer for unequal group sizes) computed
+    from the group moments of group_moments, using the studentized range distribution.
+    Returns one row per pair of groups with the statsmodels summary columns:
+    group1, group2, meandiff (group2 - group1), p-adj, lower, upper, reject.
+    """
+    from scipy import stats
+
+    n = moments['count'][variable]
+    n = n[n > 0]
+    sums = moments['sum'][variable].loc[n.index].to_numpy()
+    sumsq = moments['sumsq'][variable].loc[n.index].to_numpy()
+    groups, n = n.index.to_numpy(), n.to_numpy()
+
+    # Pooled within-group variance (the ANOVA mean squared error)
+    k, dof = len(n), n.sum() - len(n)
+    mse = (sumsq - sums ** 2 / n).sum() / dof
+    means = sums / n
+
+    first, second = np.triu_indices(k, 1)
+    mean_diff = means[second] - means[first]
+    std_pairs = np.sqrt(mse / 2 * (1 / n[first] + 1 / n[second]))
+    q_stat = np.abs(mean_diff) / std_pairs
+    q_crit = _tukey_critical_value(k, dof, alpha)
+    reject = q_stat > q_crit
+
+    # The p-value integral is the expensive part, so skip pairs that will be dropped anyway
+    keep = reject if significant_only else np.ones(len(q_stat), dtype=bool)
+    half_width = q_crit * std_pairs[keep]
+    return pd.DataFrame({
+        'group1': groups[first][keep],
+        'group2': groups[second][keep],
+        'meandiff': mean_diff[keep],
+        'p-adj': stats.studentized_range.sf(q_stat[keep], k, dof),
+        'lower': mean_diff[keep] - half_width,
+        'upper': mean_diff[keep] + half_width,
+        'reject': reject[keep]
+    })
+
+@lru_cache(maxsize=None)
+def _tukey_critical_value(k, dof, alpha):
+    """Studentized range critical value, shared by every metric with the same k and dof."""
+    from scipy import stats
+    return stats.studentized_range.ppf(1 - alpha, k, dof)
+
+@instrumentation.instrument
+def run_anova_and_tukey(df, variables, logger, output_dir="reports/tables", group_col='Course', context=None):
     """
     Runs One-Way ANOVA across different academic courses.
     If ANOVA is significant (p < 0.05), it proceeds to Tukey HSD post-hoc test.
+    Returns the significant-pair table of every such variable (full precision),
+    so later stages such as the charts can use them without re-reading the CSVs.
     """
     logger.info("--- STARTING ANOVA ANALYSIS (By Course) ---")
-    courses = df['Course'].unique()
+    # One groupby pass gives the per-course moments that both tests (and the bar charts) use for every metric
+    moments = shared_moments(df, group_col, variables, context)
+    tukey_results = shared_significant_pairs(df, group_col, variables, context, logger)
+    return report_anova_and_tukey(moments, variables, logger, output_dir, tukey_results)
+
+def report_anova_and_tukey(moments, variables, logger, output_dir="reports/tables", tukey_results=None):
+    """ANOVA and Tukey HSD reports from per-course moments (see group_moments)."""
+    if tukey_results is None:
+        tukey_results = significant_pairs(moments, variables, logger)
+    for var, sig_pairs in tukey_results.items():
+        # Save results to specific CSV for the metric (4 decimals, as in the statsmodels summary)
+        report_sink.write_table(sig_pairs.round(4), os.path.join(output_dir, f"tukey_{var}.csv"), index=False)
+    return tukey_results
+
+def shared_significant_pairs(df, group_col, variables, context=None, logger=None):
+    """significant_pairs of the shared per-group moments, memoized like shared_moments."""
+    moments = shared_moments(df, group_col, variables, context)
+    return analysis_context.memoize(context, ('significant_pairs', group_col, tuple(variables)),
+                                    lambda: significant_pairs(moments, variables, logger), df)
+
+def significant_pairs(moments, variables, logger=None, alpha=0.05):
+    """
+    ANOVA per variable, then Tukey HSD for the variables where it is significant.
+    Returns {variable: pairs with reject=True}; nothing is written to disk.
+    """
+    anova = one_way_anova(moments)
+    tukey_results = {}
     
     for var in variables:
-        # Prepare groups for ANOVA test
-        groups = [df[df['Course'] == c][var] for c in courses]
-        f_stat, p_val = stats.f_oneway(*groups)
+        f_stat, p_val = anova.loc[var, 'F-Statistic'], anova.loc[var, 'P-Value']
         
-        if p_val < 0.05:
-            logger.info(f"Significant variance detected in {var}. Running Tukey HSD...")
-            
-            # Perform Tukey HSD to find pairwise differences
-            tukey = pairwise_tukeyhsd(endog=df[var], groups=df['Course'], alpha=0.05)
-            
-            # Filter results: Save only pairs where the difference is significant (reject=True)
-            tukey_df = pd.DataFrame(tukey.summary().data[1:], columns=tukey.summary().data[0])
-            sig_pairs = tukey_df[tukey_df['reject'] == True]
+        if p_val < alpha:
+            if logger:
+                logger.info(f"Significant variance detected in {var}. Running Tukey HSD...")
             
-            # Save results to specific CSV for the metric
-            sig_pairs.to_csv(f"reports/tables/tukey_{var}.csv", index=False)
\ No newline at end of file
+            # Perform Tukey HSD and keep only pairs where the difference is significant (reject=True)
+            tukey_results[var] = tukey_hsd(moments, var, alpha=alpha, significant_only=True)
+    return tukey_results
@@ -0,0 +1,134 @@
+import os
+import tempfile
+import pandas as pd
+
+try:
+    import pyarrow.feather as feather
+    HAS_ARROW = True
+except ImportError:
+    feather = None
+    HAS_ARROW = False
+
+TEMP_SUFFIX = ".tmp"
+# mkstemp creates owner-only files; finished tables get the usual permissions
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# Format registry: name -> (reader, writer). Readers take (path, columns, **kwargs)
+# and must return only the requested columns; writers take (df, path, **kwargs).
+_FORMATS = {}
+_EXTENSIONS = {}
+
+def register_format(name, extensions, reader, writer):
+    """Adds (or replaces) a storage format and the file extensions that select it."""
+    _FORMATS[name] = (reader, writer)
+    for ext in extensions:
+        _EXTENSIONS[ext] = name
+
+def read_table(path, columns=None, fmt=None, **kwargs):
+    """
+    Loads a table from disk, reading only the requested columns when given.
+    The format is inferred from the file extension unless fmt is passed.
+    """
+    reader, _ = _FORMATS[fmt or format_for(path)]
+    return reader(path, columns, **kwargs)
+
+def write_table(df, path, fmt=None, **kwargs):
+    """
+    Saves a table to disk through a temporary file, so readers never see a
+    half-written file. The index is not stored, matching to_csv(index=False).
+    Every call gets its own temporary file, so concurrent writers of the same
+    path (e.g. parallel stages) cannot remove each other's file; the last one wins.
+    """
+    _, writer = _FORMATS[fmt or format_for(path)]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = temp_path(path)
+    try:
+        writer(df, tmp_path, **kwargs)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def temp_path(path):
+    """
+    Creates a uniquely named temporary file next to path (<name>.<random>.tmp),
+    to be written and then os.replace'd onto path. Concurrent writers of the
+    same path each get their own file. It has the usual (umask) permissions.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=f"{os.path.basename(path)}.",
+                                    suffix=TEMP_SUFFIX)
+    os.close(fd)
+    os.chmod(tmp_path, 0o666 & ~_UMASK)
+    return tmp_path
+
+def write_mapped(df, path):
+    """
+    write_table for a file that open_mapped will share between processes:
+    Feather is written uncompressed so that its buffers can be mapped as is.
+    """
+    kwargs = {"compression": "uncompressed"} if format_for(path) == "feather" else {}
+    write_table(df, path, **kwargs)
+
+def open_mapped(path):
+    """
+    Opens a table written by write_mapped without converting it to pandas:
+    a memory-mapped Arrow table for Feather files, else the loaded frame.
+    Pass the result to take_rows to get the rows a task needs.
+    """
+    if format_for(path) == "feather":
+        return feather.read_table(path, memory_map=True)
+    return read_table(path)
+
+def take_rows(table, rows, columns=None):
+    """Rows (by position) and columns of an open_mapped table, as a pandas frame."""
+    if isinstance(table, pd.DataFrame):
+        table = table if columns is None else table[columns]
+        return table.take(rows).reset_index(drop=True)
+    # Only the selected rows are copied out of the mapped buffers
+    table = table if columns is None else table.select(columns)
+    return table.take(rows).to_pandas()
+
+def format_for(path):
+    """Returns the registered format name for a file path based on its extension."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in _EXTENSIONS:
+        raise ValueError(f"No storage format registered for '{ext}' files ({path}).")
+    return _EXTENSIONS[ext]
+
+def columnar_format():
+    """Preferred binary format: memory-mapped Feather when pyarrow is installed, else pickle."""
+    return "feather" if HAS_ARROW else "pickle"
+
+def _read_csv(path, columns, **kwargs):
+    return pd.read_csv(path, usecols=columns, **kwargs)
+
+def _write_csv(df, path, **kwargs):
+    df.to_csv(path, index=False, **kwargs)
+
+def _read_feather(path, columns, **kwargs):
+    # Memory-mapping lets the OS page in only the column buffers that are requested
+    return feather.read_table(path, columns=columns, memory_map=True, **kwargs).to_pandas()
+
+def _write_feather(df, path, **kwargs):
+    df.reset_index(drop=True).to_feather(path, **kwargs)
+
+def _read_parquet(path, columns, **kwargs):
+    return pd.read_parquet(path, columns=columns, memory_map=True, **kwargs)
+
+def _write_parquet(df, path, **kwargs):
+    df.to_parquet(path, index=False, **kwargs)
+
+def _read_pickle(path, columns, **kwargs):
+    df = pd.read_pickle(path, **kwargs)
+    return df if columns is None else df[columns]
+
+def _write_pickle(df, path, **kwargs):
+    df.reset_index(drop=True).to_pickle(path, **kwargs)
+
+register_format("csv", [".csv"], _read_csv, _write_csv)
+register_format("pickle", [".pkl", ".pickle"], _read_pickle, _write_pickle)
+if HAS_ARROW:
+    register_format("feather", [".feather", ".arrow"], _read_feather, _write_feather)
+    register_format("parquet", [".parquet"], _read_parquet, _write_parquet)
@@ -0,0 +1,92 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from SRC import predictive_modeling
+from SRC import report_sink
+from SRC import stats_analysis
+from SRC import storage
+from SRC import instrumentation
+
+STRATA_DIR = "reports/strata"
+METRICS = ['Stress_Level', 'Depression_Score', 'Anxiety_Score']
+
+# Memory-mapped table shared by every task of a worker process (opened once by the pool initializer)
+_worker_table = None
+
+@instrumentation.instrument
+def run_stratified_analysis(df, keys, logger, metrics=METRICS, output_root=STRATA_DIR,
+                            max_workers=None, min_rows=10, charts=True):
+    """
+    Runs the T-Test, ANOVA/Tukey and risk stages separately for every stratum
+    defined by the key columns (e.g. Gender, Residence_Type), in a process pool.
+    With charts, each stratum also gets its bar charts, annotated from its own Tukey results.
+    Results are written to output_root/<key>=<value>/... and summarized in
+    output_root/strata_summary.csv, which is also returned.
+    """
+    keys = [keys] if isinstance(keys, str) else list(keys)
+    logger.info(f"--- STARTING STRATIFIED ANALYSIS (By {', '.join(keys)}) ---")
+    os.makedirs(output_root, exist_ok=True)
+
+    # Persist the needed columns once: workers memory-map this file, receive only
+    # row positions and convert just those rows, instead of a copy of the frame
+    columns = list(dict.fromkeys(keys + ['Course', 'Is_STEM'] + list(metrics)))
+    shared_path = os.path.join(output_root, f"_shared.{storage.columnar_format()}")
+    storage.write_mapped(df[columns], shared_path)
+
+    tasks, skipped = [], []
+    for key, rows in df.groupby(keys, observed=True, sort=True).indices.items():
+        values = key if isinstance(key, tuple) else (key,)
+        stratum = dict(zip(keys, values))
+        if len(rows) < min_rows:
+            skipped.append({**stratum, 'Rows': len(rows), 'Status': f"skipped (< {min_rows} rows)", 'Output': ''})
+            continue
+        output_dir = os.path.join(output_root, *[f"{k}={_path_safe(v)}" for k, v in stratum.items()])
+        tasks.append((stratum, rows, output_dir, list(metrics), charts))
+
+    try:
+        # Larger chunks keep scheduling overhead low when there are hundreds of strata
+        workers = max_workers or os.cpu_count() or 1
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_open_shared_table,
+                                 initargs=(shared_path,)) as pool:
+            results = list(pool.map(_run_stratum, tasks, chunksize=chunksize))
+    finally:
+        os.remove(shared_path)
+
+    summary = pd.DataFrame(results + skipped, columns=keys + ['Rows', 'Status', 'Output'])
+    report_sink.write_table(summary, os.path.join(output_root, "strata_summary.csv"), index=False)
+    logger.info(f"Stratified analysis finished: {len(results)} strata analysed, {len(skipped)} skipped.")
+    return summary
+
+def _open_shared_table(path):
+    """Pool initializer: memory-maps the shared table once per worker process."""
+    global _worker_table
+    _worker_table = storage.open_mapped(path)
+
+def _run_stratum(task):
+    """Runs the per-stratum stages inside a worker and reports the outcome."""
+    stratum, rows, output_dir, metrics, charts = task
+    logger = logging.getLogger(__name__)
+    frame = storage.take_rows(_worker_table, rows)
+
+    try:
+        stats_analysis.run_t_tests(frame, metrics, logger, output_dir)
+        tukey_results = stats_analysis.run_anova_and_tukey(frame, metrics, logger, output_dir)
+        predictive_modeling.run_risk_prediction_pipeline(frame, logger, output_dir)
+        if charts:
+            from SRC import visualization  # Plotting libraries are only loaded when charts are drawn
+            # The stratum already runs in a worker, so its charts are rendered inline
+            visualization.run_all_visualizations(frame, logger, metrics, tukey_results, max_workers=1,
+                                                 output_dir=output_dir)
+        # The stratum only counts as done once its reports are on disk
+        report_sink.flush()
+        status = "ok"
+    except Exception as exc:  # One degenerate stratum must not abort the whole run
+        logger.warning(f"Stratum {stratum} failed: {exc}")
+        status = f"failed: {exc}"
+    return {**stratum, 'Rows': len(rows), 'Status': status, 'Output': output_dir}
+
+def _path_safe(value):
+    """Turns a stratum value into a folder-name component."""
+    return str(value).replace(os.sep, "_").replace(" ", "_")
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+# Column order and category frequencies of the st_1.csv survey export
+SURVEY_COLUMNS = ['Age', 'Course', 'Gender', 'CGPA', 'Stress_Level', 'Depression_Score', 'Anxiety_Score',
+                  'Sleep_Quality', 'Physical_Activity', 'Diet_Quality', 'Social_Support', 'Relationship_Status',
+                  'Substance_Use', 'Counseling_Service_Use', 'Family_History', 'Chronic_Illness',
+                  'Financial_Stress', 'Extracurricular_Involvement', 'Semester_Credit_Load', 'Residence_Type']
+COURSES = ['Medical', 'Law', 'Engineering', 'Computer Science', 'Business', 'Others']
+COURSE_SHARES = [0.3, 0.197, 0.153, 0.146, 0.102, 0.102]
+CATEGORY_LEVELS = {
+    'Gender': {'Male': 0.505, 'Female': 0.495},
+    'Sleep_Quality': {'Good': 0.511, 'Average': 0.389, 'Poor': 0.1},
+    'Physical_Activity': {'Moderate': 0.501, 'Low': 0.298, 'High': 0.201},
+    'Diet_Quality': {'Average': 0.608, 'Good': 0.197, 'Poor': 0.195},
+    'Social_Support': {'Moderate': 0.494, 'High': 0.31, 'Low': 0.196},
+    'Relationship_Status': {'Single': 0.509, 'In a Relationship': 0.296, 'Married': 0.195},
+    'Substance_Use': {'Never': 0.842, 'Occasionally': 0.1, 'Frequently': 0.058},
+    'Counseling_Service_Use': {'Never': 0.607, 'Occasionally': 0.296, 'Frequently': 0.097},
+    'Family_History': {'No': 0.693, 'Yes': 0.307},
+    'Chronic_Illness': {'No': 0.951, 'Yes': 0.049},
+    'Extracurricular_Involvement': {'Moderate': 0.49, 'Low': 0.308, 'High': 0.202},
+    'Residence_Type': {'On-Campus': 0.401, 'Off-Campus': 0.397, 'With Family': 0.202},
+}
+# Columns with missing cells in the real export, with their observed missing rate
+MISSING_RATES = {'CGPA': 0.0017, 'Substance_Use': 0.0021}
+# The "peak" course of every score (Medical stress, Law anxiety, CS depression) is ~1.1 points higher
+PEAK_COURSES = {'Stress_Level': 'Medical', 'Anxiety_Score': 'Law', 'Depression_Score': 'Computer Science'}
+PEAK_SHIFT = 1.1
+
+def generate_survey(n_rows, n_courses=len(COURSES), missing_rates=MISSING_RATES, seed=None):
+    """
+    Generates a synthetic survey with the st_1.csv schema.
+    Courses beyond the six real ones are named Course_07, Course_08, ...
+    missing_rates maps a column to the share of cells set to missing
+    (a single float applies to CGPA and Substance_Use).
+    """
+    rng = np.random.default_rng(seed)
+    courses = (COURSES + [f"Course_{i:02d}" for i in range(len(COURSES) + 1, n_courses + 1)])[:n_courses]
+    # Real course shares for up to six courses, equal shares beyond that
+    weights = np.ones(n_courses) if n_courses > len(COURSES) else np.array(COURSE_SHARES[:n_courses])
+    course_codes = rng.choice(n_courses, n_rows, p=weights / weights.sum())
+
+    columns = {
+        'Age': rng.integers(18, 36, n_rows),
+        'Course': pd.Categorical.from_codes(course_codes, courses),
+        'CGPA': np.round(np.clip(rng.normal(3.49, 0.29, n_rows), 2.0, 4.0), 2),
+        'Financial_Stress': rng.integers(0, 6, n_rows),
+        'Semester_Credit_Load': rng.integers(15, 30, n_rows),
+    }
+    for col, peak in PEAK_COURSES.items():
+        shift = np.where(course_codes == courses.index(peak), PEAK_SHIFT, 0.0) if peak in courses else 0.0
+        columns[col] = np.clip(np.round(rng.normal(2.1 + shift, 1.6, n_rows)), 0, 5).astype(np.int64)
+    for col, levels in CATEGORY_LEVELS.items():
+        probs = np.array(list(levels.values()))
+        columns[col] = pd.Categorical.from_codes(rng.choice(len(levels), n_rows, p=probs / probs.sum()), list(levels))
+
+    df = pd.DataFrame(columns)[SURVEY_COLUMNS]
+    if not isinstance(missing_rates, dict):
+        missing_rates = {col: missing_rates for col in MISSING_RATES}
+    for col, rate in missing_rates.items():
+        df.loc[rng.random(n_rows) < rate, col] = np.nan
+    return df
+
+def write_survey(path, n_rows, chunk_rows=1_000_000, n_courses=len(COURSES), missing_rates=MISSING_RATES, seed=None):
+    """
+    Writes a synthetic survey CSV chunk by chunk, so exports far larger than
+    memory can be produced. Every chunk gets its own child seed.
+    """
+    sizes = [min(chunk_rows, n_rows - start) for start in range(0, n_rows, chunk_rows)]
+    for i, (size, child) in enumerate(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes)))):
+        chunk = generate_survey(size, n_courses, missing_rates, child)
+        chunk.to_csv(path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+    return path
@@ -1,36 +1,51 @@
 import pandas as pd
 import logging
-from factor_analyzer import FactorAnalyzer
-from factor_analyzer.factor_analyzer import calculate_bartlett_sphericity, calculate_kmo
+from SRC import analysis_context
+from SRC import correlation
+from SRC import efa_engine
+from SRC import report_sink
+from SRC import instrumentation
 
-def run_unsupervised_analysis(df, variables, logger):
+@instrumentation.instrument
+def run_unsupervised_analysis(df, variables, logger, comoments=None, context=None):
     """
     Manager function for unsupervised learning.
     It verifies assumptions (KMO/Bartlett) and then performs EFA to identify latent factors.
+    The correlation matrix is computed once and shared by both steps; with a
+    co-moment accumulator (see the correlation module) no rows are read at all;
+    it should be listwise over the variables, so KMO, Bartlett and the loadings
+    describe the same rows.
     """
     logger.info("--- STARTING UNSUPERVISED ANALYSIS PHASE ---")
+    if comoments is None:
+        # Listwise, like the EFA engine: the matrix and its row count describe the same rows
+        comoments = analysis_context.comoments(context, variables, df, listwise=True)
+    corr_matrix, n_obs = correlation.correlation(comoments, variables), correlation.observations(comoments, variables)
     
     # Check if the data structure is suitable for factor analysis
-    is_suitable = check_efa_assumptions(df, variables, logger)
+    is_suitable = check_efa_assumptions(df, variables, logger, corr_matrix, n_obs)
     
     if is_suitable:
         # If assumptions pass, proceed to identifying the common mental health factor
-        perform_efa(df, variables, logger)
+        perform_efa(df, variables, logger, corr_matrix)
     else:
         logger.warning("Data does not meet EFA requirements. Skipping Factor Analysis.")
 
-def check_efa_assumptions(df, variables, logger):
+def check_efa_assumptions(df, variables, logger, corr_matrix=None, n_obs=None, context=None):
     """
     Calculates KMO (sampling adequacy) and Bartlett's Test (sphericity).
     Saves the metrics to a CSV table to provide statistical justification for the EFA.
+    A precomputed corr_matrix (with its row count n_obs) skips the data pass.
     """
-    subset = df[variables]
+    if corr_matrix is None:
+        comoments = analysis_context.comoments(context, variables, df, listwise=True)
+        corr_matrix, n_obs = correlation.correlation(comoments, variables), correlation.observations(comoments, variables)
     
     # Bartlett's Test: Evaluates if variables are related (p-value < 0.05 required)
-    chi_square, p_value = calculate_bartlett_sphericity(subset)
+    chi_square, p_value = efa_engine.bartlett_sphericity(corr_matrix, n_obs)
     
     # KMO Test: Evaluates the proportion of variance among variables (score > 0.6 required)
-    kmo_all, kmo_model = calculate_kmo(subset)
+    kmo_all, kmo_model = efa_engine.kmo(corr_matrix)
     
     # Consolidate results into a clear report for the user
     assumption_results = {
@@ -40,27 +55,28 @@ def check_efa_assumptions(df, variables, logger):
     }
     
     # Save the decision-making table to the reports folder
-    pd.DataFrame(assumption_results).to_csv("reports/tables/efa_assumptions.csv", index=False)
+    report_sink.write_table(pd.DataFrame(assumption_results), "reports/tables/efa_assumptions.csv", index=False)
     logger.info(f"EFA assumptions calculated. KMO: {round(kmo_model, 3)}")
     
     return kmo_model > 0.6 and p_value < 0.05
 
-def perform_efa(df, variables, logger):
+def perform_efa(df, variables, logger, corr_matrix=None, context=None):
     """
     Executes Exploratory Factor Analysis (EFA) to discover hidden patterns.
     It reduces Stress, Anxiety, and Depression into a single 'Common Distress' factor.
+    The MINRES extraction works on the correlation matrix (computed here when not given).
     """
-    # Initialize the factor analyzer for 1 factor (Mental Distress)
-    fa = FactorAnalyzer(n_factors=1, rotation="varimax")
-    fa.fit(df[variables])
-    
-    # Extract 'Loadings' - showing how much each variable contributes to the hidden factor
+    if corr_matrix is None:
+        corr_matrix = correlation.correlation(analysis_context.comoments(context, variables, df, listwise=True), variables)
+
+    # Extract 1 factor (Mental Distress) and its 'Loadings' - showing how much
+    # each variable contributes to the hidden factor
     loadings_table = pd.DataFrame(
-        fa.loadings_, 
+        efa_engine.extract_factors(corr_matrix, n_factors=1, rotation="varimax"), 
         index=variables, 
         columns=['General_Distress_Factor']
     )
     
     # Save findings for interpretation in the research paper
-    loadings_table.to_csv("reports/tables/efa_loadings.csv")
+    report_sink.write_table(loadings_table, "reports/tables/efa_loadings.csv")
     logger.info("EFA successfully completed. Factor loadings saved to tables folder.")
\ No newline at end of file
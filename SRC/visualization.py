@@ -1,90 +1,235 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import seaborn as sns
-import matplotlib.pyplot as plt
-
-def annotate_significance(ax, variable, order):
-    """
-    Adds visual markers (red asterisks) above specific bars to indicate 
-    statistical significance found in Tukey HSD post-hoc tests.
-    """
-    # Mapping each variable to the group that showed significant deviation in analysis
-    highlights = {
-        'Stress_Level': 'Medical',
-        'Anxiety_Score': 'Law',
-        'Depression_Score': 'Computer Science'
-    }
-    
-    if variable in highlights:
-        target_group = highlights[variable]
-        # Iterate through the bars to find the match and place the star
-        for i, bar_name in enumerate(order):
-            if bar_name == target_group:
-                # Get the height of the bar to position the text above it
-                height = ax.patches[i].get_height()
-                ax.text(i, height + 0.1, '*', ha='center', fontsize=25, 
-                        color='red', fontweight='bold')
-
-def create_bar_plot(df, variable, title, logger):
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from SRC import analysis_context
+from SRC import correlation
+from SRC import report_sink
+from SRC import stats_analysis
+from SRC import instrumentation
+
+FIGURES_DIR = "reports/figures"
+METRICS = ['Stress_Level', 'Depression_Score', 'Anxiety_Score']
+# Plural chart labels of the count-like metrics; any other column is titled by its name as is
+METRIC_LABELS = {
+    'Stress_Level': 'Stress Levels',
+    'Depression_Score': 'Depression Scores',
+    'Anxiety_Score': 'Anxiety Scores',
+}
+
+def annotate_significance(ax, order, markers):
+    """
+    Adds visual markers (red asterisks) above the bars of the groups listed in
+    markers ({group: marker}, see significance_markers) to indicate statistical
+    significance found in Tukey HSD post-hoc tests.
+    """
+    # Iterate through the bars to find the marked groups and place the star
+    for i, bar_name in enumerate(order):
+        if bar_name in markers:
+            # Get the height of the bar to position the text above it
+            height = ax.patches[i].get_height()
+            ax.text(i, height + 0.1, markers[bar_name], ha='center', fontsize=25,
+                    color='red', fontweight='bold')
+
+def significance_markers(sig_pairs, groups, marker='*'):
+    """
+    Derives the bar markers from a Tukey significant-pair table (as returned by
+    stats_analysis.run_anova_and_tukey): a group is marked when it differs
+    significantly from every other group. Works for any number of groups.
+    """
+    groups = list(groups)
+    if sig_pairs is None or len(groups) < 2:
+        return {}
+    rejected = sig_pairs[sig_pairs['reject']]
+    partners = {group: set() for group in groups}
+    for first, second in zip(rejected['group1'], rejected['group2']):
+        partners.setdefault(first, set()).add(second)
+        partners.setdefault(second, set()).add(first)
+    return {group: marker for group in groups if len(partners[group] & set(groups)) == len(groups) - 1}
+
+def chart_title(variable, markers, group_label='Courses'):
+    """Builds the chart title from the metric name and the marked groups."""
+    title = f"{METRIC_LABELS.get(variable, variable.replace('_', ' '))} Across {group_label}"
+    return f"{title} ({' & '.join(markers)} Group Significance)" if markers else title
+
+def course_summary(df, variables, group_col='Course', context=None):
+    """
+    Computes the mean, standard error and size of every variable per group in
+    one groupby pass. Charts are drawn from this small table, never from the rows.
+    Returns a frame indexed by group with columns (variable, statistic).
+    """
+    return summary_from_moments(stats_analysis.shared_moments(df, group_col, list(variables), context), variables)
+
+def summary_from_moments(moments, variables):
+    """The course_summary table derived from per-group moments (see stats_analysis.group_moments)."""
+    columns = {}
+    for var in variables:
+        n, sums, sumsq = moments[('count', var)], moments[('sum', var)], moments[('sumsq', var)]
+        variance = ((sumsq - sums ** 2 / n) / (n - 1)).clip(lower=0)
+        columns[(var, 'mean')] = sums / n
+        columns[(var, 'sem')] = (variance / n) ** 0.5
+        columns[(var, 'count')] = n.astype('int64')
+    return pd.DataFrame(columns)
+
+def create_bar_plot(df, variable, title, logger, markers=None, context=None):
     """
     Generates a high-quality bar chart for a mental health metric.
-    Includes Standard Error (SE) bars to represent data variability 
-    and calls annotate_significance for post-hoc markers.
+    Includes Standard Error (SE) bars to represent data variability
+    and post-hoc markers (computed from an in-memory Tukey HSD when not given).
     """
-    plt.figure(figsize=(10, 6))
-    sns.set_theme(style="whitegrid", palette="muted")
-    
-    # Sort courses by their mean values for a clearer, descending visualization
-    order = df.groupby('Course')[variable].mean().sort_values(ascending=False).index
-    
-    # Draw the bar plot with standard error bars (SE)
-    ax = sns.barplot(data=df, x='Course', y=variable, order=order, capsize=.1, errorbar='se')
-    
-    # Configure plot labels and titles
-    plt.title(title, fontsize=15, pad=15)
-    plt.ylabel(f"Average {variable.replace('_', ' ')}")
-    plt.xlabel("Academic Course")
-    plt.xticks(rotation=45)
-    
-    # Add post-hoc significance markers
-    annotate_significance(ax, variable, order)
-    
-    # Save the chart as a high-resolution PNG
-    plt.tight_layout()
-    plt.savefig(f"reports/figures/{variable}_comparison.png")
-    plt.close() # Free memory after saving
+    summary = course_summary(df, [variable], context=context)
+    if markers is None:
+        tukey_results = stats_analysis.shared_significant_pairs(df, 'Course', [variable], context)
+        markers = significance_markers(tukey_results.get(variable), summary.index)
+    render_charts([bar_chart_task(summary, variable, title, markers)], max_workers=1)
     logger.info(f"Scientific bar chart for {variable} saved successfully.")
 
-def run_all_visualizations(df, logger):
+def bar_chart_task(summary, variable, title, markers=None, output_dir=FIGURES_DIR):
+    """Packs everything one bar chart needs (its slice of the summary table) into a picklable task."""
+    # Sort courses by their mean values for a clearer, descending visualization
+    stats = summary[variable].sort_values('mean', ascending=False)
+    return ('bar', {
+        'variable': variable,
+        'title': title,
+        'order': list(stats.index),
+        'means': stats['mean'].to_numpy(),
+        'errors': stats['sem'].fillna(0).to_numpy(),
+        'markers': dict(markers or {}),
+        'output_path': os.path.join(output_dir, f"{variable}_comparison.png"),
+    })
+
+def chart_tasks(df, variables, tukey_results=None, output_dir=FIGURES_DIR, group_col='Course', context=None):
+    """
+    Chart tasks for every variable of one cohort: one moments pass (shared through
+    the analysis context, if any) gives the summary table and, when the Tukey
+    results are not supplied, the markers and titles.
+    """
+    summary = course_summary(df, variables, group_col, context)
+    if tukey_results is None:
+        tukey_results = stats_analysis.shared_significant_pairs(df, group_col, variables, context)
+    tasks = []
+    for var in variables:
+        markers = significance_markers(tukey_results.get(var), summary.index)
+        tasks.append(bar_chart_task(summary, var, chart_title(var, markers), markers, output_dir))
+    return tasks
+
+def render_charts(tasks, max_workers=None):
+    """
+    Renders chart tasks to PNG files, in a process pool when there is more than
+    one. Workers only receive the small precomputed tables and draw with the Agg
+    canvas and the Figure API, so no pyplot global state is shared.
+    PNG encoding goes through the report sink; every file is on disk when this
+    returns. Returns the written paths.
+    """
+    workers = min(max_workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        paths = [_render(task) for task in tasks]
+        report_sink.flush()
+        return paths
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_render_and_flush, tasks))
+
+def _render(task):
+    """Dispatches one task to its renderer."""
+    kind, spec = task
+    return {'bar': _render_bar_chart, 'heatmap': _render_heatmap}[kind](**spec)
+
+def _render_and_flush(task):
+    """Renders one task inside a worker and waits for its file to be written."""
+    path = _render(task)
+    report_sink.flush()
+    return path
+
+def _render_bar_chart(variable, title, order, means, errors, markers, output_path):
+    """Draws a sorted bar chart with standard error bars and significance markers."""
+    with sns.axes_style("whitegrid"), sns.plotting_context("notebook"):
+        fig = Figure(figsize=(10, 6))
+        FigureCanvasAgg(fig)
+        ax = fig.subplots()
+
+        positions = range(len(order))
+        # Same look as sns.barplot: desaturated palette color, no grid along the categories
+        ax.bar(positions, means, width=0.8, color=sns.desaturate(sns.color_palette("muted")[0], 0.75))
+        # Draw the standard error bars (SE)
+        ax.errorbar(positions, means, yerr=errors, fmt='none', ecolor='.26', elinewidth=2.5,
+                    capsize=8, capthick=2.5)
+        ax.set_xlim(-0.5, len(order) - 0.5)
+        ax.grid(False, axis='x')
+
+        # Configure plot labels and titles
+        ax.set_title(title, fontsize=15, pad=15)
+        ax.set_ylabel(f"Average {variable.replace('_', ' ')}")
+        ax.set_xlabel("Academic Course")
+        ax.set_xticks(list(positions), order, rotation=45)
+
+        # Add post-hoc significance markers
+        annotate_significance(ax, order, markers)
+        if markers:
+            # Leave headroom so the markers are not clipped by the top of the axes
+            ax.set_ylim(top=max(ax.get_ylim()[1], max(means + errors) + 0.35))
+
+        # Save the chart as a high-resolution PNG
+        fig.tight_layout()
+        return report_sink.write_figure(fig, output_path)
+
+def _render_heatmap(corr_matrix, title, output_path):
+    """Draws an annotated correlation heatmap."""
+    with sns.axes_style("white"), sns.plotting_context("notebook"):
+        fig = Figure(figsize=(8, 6))
+        FigureCanvasAgg(fig)
+        ax = fig.subplots()
+        # Visualize the matrix using a heatmap with numerical annotations
+        sns.heatmap(corr_matrix, annot=True, cmap='coolwarm', center=0, fmt=".2f", ax=ax)
+        ax.set_title(title, fontsize=14, pad=15)
+        fig.tight_layout()
+        return report_sink.write_figure(fig, output_path)
+
+@instrumentation.instrument
+def run_all_visualizations(df, logger, variables=METRICS, tukey_results=None, max_workers=None,
+                           output_dir=FIGURES_DIR, context=None):
     """
     The orchestrator function for standard supervised plots.
-    Iterates through the primary mental health metrics and generates charts.
+    Summarizes every metric per course once, derives the significance markers
+    and titles from the Tukey results, then renders the charts in parallel.
     """
-    # Configuration for plot titles based on primary research findings
-    plot_config = {
-        'Stress_Level': 'Stress Levels Across Courses (Medical Group Significance)',
-        'Anxiety_Score': 'Anxiety Scores Across Courses (Law Group Significance)',
-        'Depression_Score': 'Depression Scores Across Courses (CS Group Significance)'
-    }
-    
-    for var, title in plot_config.items():
-        create_bar_plot(df, var, title, logger)
+    render_charts(chart_tasks(df, variables, tukey_results, output_dir, context=context), max_workers)
+    for var in variables:
+        logger.info(f"Scientific bar chart for {var} saved successfully.")
 
-def plot_correlation_heatmap(df, variables, logger):
+@instrumentation.instrument
+def render_cohort_charts(cohorts, variables, logger, tukey_results=None, max_workers=None):
+    """
+    Batch chart generation: cohorts maps an output folder to a frame (e.g. one
+    per stratum or data wave), tukey_results optionally maps the same folders
+    to their Tukey results. All charts of all cohorts go through one process pool.
+    """
+    tukey_results = tukey_results or {}
+    tasks = []
+    for output_dir, frame in cohorts.items():
+        tasks += chart_tasks(frame, variables, tukey_results.get(output_dir), output_dir)
+    paths = render_charts(tasks, max_workers)
+    logger.info(f"{len(paths)} charts rendered for {len(cohorts)} cohorts.")
+    return paths
+
+@instrumentation.instrument
+def plot_correlation_heatmap(df, variables, logger, corr_matrix=None, context=None):
     """
     Generates a correlation heatmap to identify relationships between metrics.
     Essential for justifying the underlying structure before EFA.
+    A precomputed corr_matrix (e.g. from the incremental state or a saved
+    co-moment accumulator) skips the data pass.
     """
-    plt.figure(figsize=(8, 6))
-    # Calculate Pearson correlation coefficients
-    corr_matrix = df[variables].corr()
-    
-    # Visualize the matrix using a heatmap with numerical annotations
-    sns.heatmap(corr_matrix, annot=True, cmap='coolwarm', center=0, fmt=".2f")
-    
-    plt.title("Correlation Matrix: Mental Health Metrics", fontsize=14, pad=15)
-    plt.tight_layout()
-    
+    # Calculate Pearson correlation coefficients (chunked, pairwise-complete like DataFrame.corr)
+    if corr_matrix is None:
+        corr_matrix = correlation.correlation(analysis_context.comoments(context, variables, df), variables)
+
     # Save the heatmap for the factor analysis justification
-    plt.savefig("reports/figures/correlation_heatmap.png")
-    plt.close()
-    logger.info("Correlation heatmap generated and saved in reports/figures/.")
\ No newline at end of file
+    task = ('heatmap', {
+        'corr_matrix': corr_matrix,
+        'title': "Correlation Matrix: Mental Health Metrics",
+        'output_path': os.path.join(FIGURES_DIR, "correlation_heatmap.png"),
+    })
+    render_charts([task], max_workers=1)
+    logger.info("Correlation heatmap generated and saved in reports/figures/.")
@@ -1,46 +1,253 @@
-import pandas as pd
-from SRC import data_cleaning  # Data pre-processing logic
-from SRC import stats_analysis # Supervised statistical logic
-from SRC import visualization     # Graphing and visualization logic
-from SRC import unsupervised   # Unsupervised analysis (EFA) logic
+import time
+_IMPORT_START = time.perf_counter()
+import argparse
+import os
 import warnings
+from datetime import datetime
+# Only light modules (pandas/numpy) are imported at startup; seaborn, matplotlib,
+# scipy.stats, sklearn and factor_analyzer are imported inside the stages that use them
+from SRC import clean_cache    # Cached data pre-processing
+from SRC import analysis_context # Group splits and aggregates shared by the stages of one process
+from SRC import data_cleaning
+from SRC import correlation    # Out-of-core co-moments behind the heatmap and EFA
+from SRC import stats_analysis # Supervised statistical logic (scipy is loaded on first use)
 from SRC import predictive_modeling
+from SRC import pipeline_dag  # Stage DAG executor (parallel, skip-if-fresh)
+from SRC import instrumentation # Per-stage metrics in logs/pipeline_metrics.jsonl
+from SRC import report_sink    # Background, atomic report writer
+STARTUP_IMPORT_SECONDS = time.perf_counter() - _IMPORT_START
 # This silences the specific pandas warnings you saw
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
-def main():
+RAW_PATH = 'data/st_1.csv'
+CLEAN_PATH = 'data/clean_data.csv'
+METRICS = ['Stress_Level', 'Depression_Score', 'Anxiety_Score']
+# Downstream stages only use the metrics, the grouping columns and the
+# risk-model features, so only these are loaded from the columnar cache
+ANALYSIS_COLUMNS = list(dict.fromkeys(['Course', 'Is_STEM'] + METRICS + predictive_modeling.RISK_FEATURES))
+# Co-moments of every numeric survey column, accumulated once from the cleaned CSV
+CORRELATION_COLUMNS = [col for col, dtype in data_cleaning.CLEAN_SCHEMA.items() if dtype != 'category']
+COMOMENTS_PATH = 'data/cache/comoments.npz'
+# Listwise co-moments of the EFA metrics: KMO, Bartlett and the loadings all rest on the same rows
+EFA_COMOMENTS_PATH = 'data/cache/efa_comoments.npz'
+# Analysis context of this process (see load_context), keyed by the clean stage's output
+_CONTEXTS = {}
+# Bootstrap / permutation replicates behind the confidence intervals in the reports
+N_RESAMPLES = 10_000
+RANDOM_SEED = 42
+# Stages run by every CLI subcommand ('all' runs the whole DAG)
+COMMANDS = {
+    'clean': ['clean'],
+    'stats': ['clean', 't_tests', 'anova_tukey'],
+    'risk': ['clean', 'risk_report', 'risk_model'],
+    'plots': ['clean', 'bar_plots', 'correlation', 'heatmap'],
+    'efa': ['clean', 'correlation', 'efa'],
+    'all': None,
+    'incremental': [],
+}
+
+def main(argv=None):
     """
     Main entry point for the Student Mental Health Analysis Pipeline.
     Orchestrates the research flow: Setup -> Pre-process -> Statistics -> Visualization -> EFA.
+    The subcommand selects the stages to run (see COMMANDS); 'incremental' only
+    processes the rows appended to the raw file since the last run and rebuilds
+    the moment-based reports from the saved state.
     """
+    args = build_parser().parse_args(argv)
+
     # Step 1: Initialize Logging and Output Directories
     # This ensures all analysis is documented and folders are ready for files
     logger = stats_analysis.setup_environment()
-    
-    # Step 2: Data Pipeline - Load raw CSV and clean it
-    # We load the raw database and apply mapping to categorical strings
-    logger.info("Initializing Data Pipeline...")
-    raw_data = pd.read_csv('data/st_1.csv')
-    df_clean = data_cleaning.pre_process(raw_data)
-    
-    # Step 3: Analytics - Run T-Tests and ANOVA
-    # Defined metrics to analyze across STEM and academic courses
-    metrics = ['Stress_Level', 'Depression_Score', 'Anxiety_Score']
-    stats_analysis.run_t_tests(df_clean, metrics, logger)
-    stats_analysis.run_anova_and_tukey(df_clean, metrics, logger)
-    predictive_modeling.run_risk_prediction_pipeline(df_clean, logger)
-    
-    # Step 4: Visualization - Generate and save scientific plots
-    # Creates sorted bar charts with significance markers
-    visualization.run_all_visualizations(df_clean, logger)
-
-    # Step 5: Unsupervised Analysis - Explore Latent Factor structure (EFA)
-    # Checks for correlations and combines indicators into a single distress factor
-    visualization.plot_correlation_heatmap(df_clean, metrics, logger)
-    unsupervised.run_unsupervised_analysis(df_clean, metrics, logger)
-
-    logger.info("Full Research Pipeline Complete. All results available in 'reports/'.")
+    instrumentation.configure(profile=args.profile, trace_memory=args.trace_memory)
+    # Reports are written by a background thread (per process); the pipeline waits for them at the end
+    report_sink.configure(async_writes=not args.sync_reports)
+
+    if args.command == 'incremental':
+        from SRC import incremental   # Mergeable state for appended survey waves
+        state = incremental.update_incremental_state(RAW_PATH, logger, metrics=METRICS)
+        incremental.run_incremental_reports(state, logger, n_resamples=N_RESAMPLES, seed=RANDOM_SEED)
+        finish_reports(args, logger)
+        logger.info("Incremental update complete. Reports refreshed in 'reports/'.")
+        return
+
+    stages = select_stages(pipeline_stages(stream=args.stream, chunksize=args.chunksize), args.command)
+    if args.import_times:
+        report_import_times(stages, logger)
+
+    # Steps 2-5 run as a stage DAG: cleaning first, then every analysis that only
+    # needs the cleaned data in parallel. Stages whose inputs and code are unchanged
+    # since their outputs were written are skipped.
+    logger.info(f"Initializing Data Pipeline ({args.command})...")
+    workers = args.workers or min(os.cpu_count() or 1, max(1, len(stages) - 1))
+    summary = pipeline_dag.run_stages(stages, logger, max_workers=workers, force=args.force)
+    logger.info(f"Stage summary:\n{summary.to_string(index=False)}")
+    finish_reports(args, logger)
+
+    logger.info(f"Research Pipeline ({args.command}) Complete. All results available in 'reports/'.")
+
+def build_parser():
+    """Command-line interface: python main.py [clean|stats|risk|plots|efa|all|incremental] [options]."""
+    parser = argparse.ArgumentParser(description="Student Mental Health Analysis Pipeline")
+    parser.add_argument('command', nargs='?', default='all', choices=list(COMMANDS),
+                        help="stages to run (default: all)")
+    parser.add_argument('--force', action='store_true', help="re-run stages even when their outputs are fresh")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes for independent stages")
+    parser.add_argument('--import-times', action='store_true',
+                        help="print how long the startup and per-stage imports take")
+    parser.add_argument('--profile', action='store_true', help="write a cProfile dump per stage to logs/profiles/")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="also record the tracemalloc peak of every stage (slower)")
+    parser.add_argument('--sync-reports', action='store_true',
+                        help="write every report before moving on (no background writer)")
+    parser.add_argument('--stream', action='store_true',
+                        help="clean the raw file chunk by chunk (for exports larger than memory; not cached)")
+    parser.add_argument('--chunksize', type=int, default=clean_cache.STREAM_CHUNKSIZE,
+                        help=f"rows per chunk with --stream (default: {clean_cache.STREAM_CHUNKSIZE})")
+    parser.add_argument('--bundle', action='store_true',
+                        help=f"also pack reports/tables and reports/figures into one zip in {report_sink.BUNDLE_DIR}/")
+    return parser
+
+def finish_reports(args, logger):
+    """Queues the optional run bundle, then waits until every report is on disk."""
+    if args.bundle:
+        bundle_path = os.path.join(report_sink.BUNDLE_DIR, f"run-{datetime.now():%Y%m%d-%H%M%S}.zip")
+        report_sink.write_bundle(bundle_path)
+        logger.info(f"Report bundle queued: {bundle_path}")
+    report_sink.flush()
+
+def select_stages(stages, command):
+    """Keeps the stages a subcommand needs, in declaration order."""
+    names = COMMANDS[command]
+    return stages if names is None else [s for s in stages if s['name'] in names]
+
+def report_import_times(stages, logger):
+    """Prints (and logs) the startup import time and the first-import cost of every stage's modules."""
+    lines = [f"{STARTUP_IMPORT_SECONDS * 1000:>8.1f} ms  startup (main.py imports)"]
+    lines += [f"{seconds * 1000:>8.1f} ms  {module} ({stage_name})"
+              for module, stage_name, seconds in pipeline_dag.measure_imports(stages)]
+    report = "Import times:\n" + "\n".join(lines)
+    print(report)
+    logger.info(report)
+
+def pipeline_stages(metrics=METRICS, stream=False, chunksize=clean_cache.STREAM_CHUNKSIZE):
+    """
+    Declares the research flow as stages with their input and output files.
+    With stream=True the clean stage cleans the raw file in chunks of chunksize rows.
+    """
+    tables, figures = "reports/tables", "reports/figures"
+    clean = [CLEAN_PATH]
+    # Code of every stage that loads the cleaned data (the SRC modules they import are added by the DAG)
+    reads_clean = ['SRC.clean_cache', load_clean, load_context]
+    return [
+        # Step 2: Data Pipeline - Load raw CSV and clean it (served from the on-disk cache when possible).
+        # Later stages read exactly what this stage exported (see clean_cache.load_exported)
+        pipeline_dag.stage("clean", stage_clean, inputs=[RAW_PATH],
+                           outputs=clean if stream else clean + [CLEAN_PATH + clean_cache.KEY_SUFFIX],
+                           code=['SRC.clean_cache'], imports=['SRC.clean_cache'],
+                           params={'stream': stream, 'chunksize': chunksize} if stream else {}),
+        # Step 3: Analytics - T-Tests, ANOVA/Tukey and risk prediction
+        pipeline_dag.stage("t_tests", stage_t_tests, inputs=clean, outputs=[f"{tables}/t_test_results.csv"],
+                           code=['SRC.stats_analysis'] + reads_clean, imports=['scipy.stats'],
+                           params={'metrics': metrics, 'n_resamples': N_RESAMPLES, 'seed': RANDOM_SEED}),
+        pipeline_dag.stage("anova_tukey", stage_anova_tukey, inputs=clean, outputs=[f"{tables}/tukey_*.csv"],
+                           code=['SRC.stats_analysis'] + reads_clean, imports=['scipy.stats'],
+                           params={'metrics': metrics}),
+        pipeline_dag.stage("risk_report", stage_risk_report, inputs=clean,
+                           outputs=[f"{tables}/risk_prediction_report.txt"],
+                           code=['SRC.predictive_modeling'] + reads_clean,
+                           params={'n_resamples': N_RESAMPLES, 'seed': RANDOM_SEED}),
+        pipeline_dag.stage("risk_model", stage_risk_model, inputs=clean, outputs=[predictive_modeling.MODEL_PATH],
+                           code=['SRC.predictive_modeling'] + reads_clean,
+                           imports=['sklearn.linear_model', 'sklearn.metrics']),
+        # Step 4: Visualization - sorted bar charts with significance markers
+        pipeline_dag.stage("bar_plots", stage_bar_plots, inputs=clean, outputs=[f"{figures}/*_comparison.png"],
+                           code=['SRC.visualization'] + reads_clean, imports=['SRC.visualization']),
+        # Step 5: Unsupervised Analysis - correlation structure and EFA, both from saved co-moments
+        pipeline_dag.stage("correlation", stage_correlation, inputs=clean,
+                           outputs=[COMOMENTS_PATH, EFA_COMOMENTS_PATH], code=['SRC.correlation'],
+                           params={'columns': CORRELATION_COLUMNS, 'metrics': metrics}),
+        pipeline_dag.stage("heatmap", stage_heatmap, inputs=[COMOMENTS_PATH],
+                           outputs=[f"{figures}/correlation_heatmap.png"],
+                           code=['SRC.visualization', 'SRC.correlation'], imports=['SRC.visualization'],
+                           params={'metrics': metrics}),
+        pipeline_dag.stage("efa", stage_efa, inputs=[EFA_COMOMENTS_PATH], outputs=[f"{tables}/efa_*.csv"],
+                           code=['SRC.unsupervised', 'SRC.correlation'], imports=['SRC.unsupervised'],
+                           params={'metrics': metrics}),
+    ]
+
+def load_clean(logger):
+    """
+    Cleaned analysis columns as exported by the clean stage (from its columnar
+    cache entry when available). The raw file is not read again, so parallel
+    stages never clean it concurrently.
+    """
+    df = clean_cache.load_exported(CLEAN_PATH, columns=ANALYSIS_COLUMNS)
+    logger.info(f"Cleaned dataset loaded ({len(df)} rows, as exported to {CLEAN_PATH}).")
+    return df
+
+def load_context(logger):
+    """
+    The analysis context of the cleaned data: stages running in the same process
+    (inline, or one after another in a pool worker) share one frame and its
+    memoized group splits, moments and risk tables. A new cleaned dataset
+    replaces the context. It is keyed by the clean stage's output (the cache key
+    recorded next to the export, and the export's size and mtime), so no stage
+    hashes the raw file.
+    """
+    stat = os.stat(CLEAN_PATH) if os.path.exists(CLEAN_PATH) else None
+    key = (clean_cache.written_key(CLEAN_PATH), stat and (stat.st_size, stat.st_mtime_ns))
+    if key not in _CONTEXTS:
+        _CONTEXTS.clear()
+        _CONTEXTS[key] = analysis_context.new_context(load_clean(logger))
+    return _CONTEXTS[key]
+
+def stage_clean(logger, stream=False, chunksize=clean_cache.STREAM_CHUNKSIZE):
+    if stream:
+        # Bounded memory: the raw file is never loaded whole (and the result is not cached)
+        clean_cache.stream_clean_data(RAW_PATH, logger, output_path=CLEAN_PATH, chunksize=chunksize)
+    else:
+        clean_cache.load_clean_data(RAW_PATH, logger, output_path=CLEAN_PATH, columns=ANALYSIS_COLUMNS)
+
+def stage_t_tests(logger, metrics, n_resamples, seed):
+    context = load_context(logger)
+    stats_analysis.run_t_tests(context['df'], metrics, logger, n_resamples=n_resamples, seed=seed, context=context)
+
+def stage_anova_tukey(logger, metrics):
+    context = load_context(logger)
+    stats_analysis.run_anova_and_tukey(context['df'], metrics, logger, context=context)
+
+def stage_risk_report(logger, n_resamples, seed):
+    context = load_context(logger)
+    predictive_modeling.run_risk_prediction_pipeline(context['df'], logger, n_resamples=n_resamples, seed=seed,
+                                                     context=context)
+
+def stage_risk_model(logger):
+    predictive_modeling.fit_risk_model(load_context(logger)['df'], logger)
+
+def stage_bar_plots(logger):
+    from SRC import visualization     # Graphing and visualization logic (seaborn/matplotlib)
+    context = load_context(logger)
+    visualization.run_all_visualizations(context['df'], logger, context=context)
+
+def stage_correlation(logger, columns, metrics):
+    # Streams the cleaned CSV chunk by chunk, so this also works for exports larger than memory.
+    # The heatmap uses pairwise-complete co-moments; the EFA gets listwise ones over its own
+    # metrics, so its row count matches the rows behind every correlation (as in efa_engine)
+    correlation.save_comoments(correlation.accumulate(CLEAN_PATH, columns), COMOMENTS_PATH)
+    correlation.save_comoments(correlation.accumulate(CLEAN_PATH, metrics, listwise=True), EFA_COMOMENTS_PATH)
+    logger.info(f"Co-moments of {len(columns)} numeric columns saved to {COMOMENTS_PATH} "
+                f"(listwise EFA co-moments to {EFA_COMOMENTS_PATH}).")
+
+def stage_heatmap(logger, metrics):
+    from SRC import visualization
+    corr_matrix = correlation.correlation(correlation.load_comoments(COMOMENTS_PATH), metrics)
+    visualization.plot_correlation_heatmap(None, metrics, logger, corr_matrix=corr_matrix)
+
+def stage_efa(logger, metrics):
+    from SRC import unsupervised   # Unsupervised analysis (EFA) logic
+    unsupervised.run_unsupervised_analysis(None, metrics, logger, comoments=correlation.load_comoments(EFA_COMOMENTS_PATH))
 
 if __name__ == "__main__":
-    # Execute the research pipeline
+    # Execute the research pipeline (e.g. `python main.py risk`; default: all stages)
     main()
\ No newline at end of file
@@ -7,6 +7,19 @@ from SRC import stats_analysis
 from SRC import visualization
 from SRC import unsupervised
 from SRC import predictive_modeling
+from SRC import clean_cache
+from SRC import storage
+from SRC import stratified
+from SRC import resampling
+from SRC import incremental
+from SRC import pipeline_dag
+from SRC import synthetic
+from SRC import benchmark
+from SRC import instrumentation
+from SRC import efa_engine
+from SRC import correlation
+from SRC import report_sink
+from SRC import analysis_context
 
 @pytest.fixture(autouse=True)
 def isolate_tests(tmp_path, monkeypatch):
@@ -75,6 +88,166 @@ def test_data_processing_logic(sample_data):
     # 3. Score Range check (0-5)
     assert (df_clean['Stress_Level'] <= 5).all()
 
+def test_ordinal_encoding_table(sample_data):
+    """Verify every ordinal column is encoded to int8 codes following the shared table."""
+    df_clean = data_cleaning.pre_process(sample_data)
+
+    for col, levels in data_cleaning.ORDINAL_ENCODINGS.items():
+        assert df_clean[col].dtype == np.int8
+        expected = sample_data.loc[df_clean.index, col].map({label: i + 1 for i, label in enumerate(levels)})
+        assert (df_clean[col] == expected).all()
+
+    # Categorical input (the fast path) must give identical codes
+    categorical = data_cleaning.encode_ordinals(sample_data.astype(data_cleaning.ORDINAL_DTYPES))
+    plain = data_cleaning.encode_ordinals(sample_data.copy())
+    pd.testing.assert_frame_equal(categorical[list(data_cleaning.ORDINAL_ENCODINGS)],
+                                  plain[list(data_cleaning.ORDINAL_ENCODINGS)])
+
+def test_clean_schema_compact_dtypes():
+    """The cleaned frame uses the compact schema dtypes, and the analysis results do not change."""
+    synthetic.generate_survey(2000, seed=4).to_csv("data/survey.csv", index=False)
+    typed = data_cleaning.pre_process(pd.read_csv("data/survey.csv", dtype=data_cleaning.READ_DTYPES), output_path=None)
+    plain = data_cleaning.pre_process(pd.read_csv("data/survey.csv"), output_path=None, schema=None)
+    for col, dtype in data_cleaning.CLEAN_SCHEMA.items():
+        assert typed[col].dtype == dtype, col
+    assert typed.memory_usage(deep=True).sum() * 5 < plain.memory_usage(deep=True).sum()
+
+    metrics = ['Stress_Level', 'Depression_Score', 'Anxiety_Score']
+    pd.testing.assert_frame_equal(stats_analysis.compare_groups(typed, metrics),
+                                  stats_analysis.compare_groups(plain, metrics))
+    assert np.allclose(predictive_modeling.compute_risk_table(typed).to_numpy(),
+                       predictive_modeling.compute_risk_table(plain).to_numpy())
+
+    # A value that would not survive the cast keeps the column's original dtype
+    gappy = data_cleaning.apply_schema(pd.DataFrame({'Age': [20.0, np.nan], 'Stress_Level': [3, 300]}))
+    assert gappy['Age'].dtype == np.float64 and gappy['Stress_Level'].dtype == np.int64
+
+def test_fused_filter_bounds_semantics(sample_data):
+    """Verify sequential bounds reproduce the per-column filter loop and simultaneous bounds use the full frame."""
+    sample_data.loc[0, 'Age'] = 150
+    sample_data.loc[3, 'CGPA'] = 9.0
+
+    # Reference: the original one-filter-per-column loop
+    expected = data_cleaning.encode_ordinals(sample_data.copy())
+    for col in data_cleaning.OUTLIER_COLUMNS:
+        q1, q3 = expected[col].quantile(0.25), expected[col].quantile(0.75)
+        expected = expected[(expected[col] >= q1 - 1.5 * (q3 - q1)) & (expected[col] <= q3 + 1.5 * (q3 - q1))]
+    assert list(data_cleaning.pre_process(sample_data).index) == list(expected.index)
+
+    bounds = data_cleaning.outlier_bounds(sample_data, sequential_bounds=False)
+    q1, q3 = sample_data['CGPA'].quantile(0.25), sample_data['CGPA'].quantile(0.75)
+    assert bounds['CGPA'] == (q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1))
+
+def test_streaming_matches_in_memory(sample_data):
+    """Verify the chunked cleaning path writes the same dataset as pre_process."""
+    sample_data.loc[2, 'CGPA'] = np.nan
+    sample_data.to_csv("data/raw.csv", index=False)
+
+    expected = data_cleaning.pre_process(sample_data).reset_index(drop=True)
+    rows = data_cleaning.pre_process_stream("data/raw.csv", "data/streamed.csv", chunksize=2)
+
+    assert rows == len(expected)
+    pd.testing.assert_frame_equal(pd.read_csv("data/streamed.csv"), pd.read_csv("data/clean_data.csv"))
+
+    # The CLI path (clean --stream) leaves an export that the analysis stages read as is
+    logger = stats_analysis.setup_environment()
+    clean_cache.stream_clean_data("data/raw.csv", logger, "data/streamed.csv", chunksize=2)
+    assert clean_cache.written_key("data/streamed.csv") is None
+    pd.testing.assert_frame_equal(clean_cache.load_exported("data/streamed.csv"), data_cleaning.apply_schema(expected),
+                                  check_categorical=False)
+
+def test_streaming_missing_ordinal_in_one_chunk(sample_data):
+    """Verify an unknown ordinal label in a single chunk exports the same text as pre_process."""
+    sample_data.loc[5, 'Sleep_Quality'] = 'Unknown'  # Only the last chunk has a missing code
+    sample_data.to_csv("data/raw.csv", index=False)
+
+    data_cleaning.pre_process(sample_data)
+    data_cleaning.pre_process_stream("data/raw.csv", "data/streamed.csv", chunksize=2)
+    with open("data/streamed.csv") as streamed, open("data/clean_data.csv") as in_memory:
+        assert streamed.read() == in_memory.read()
+    assert data_cleaning.encode_ordinals(sample_data.copy())['Sleep_Quality'].dtype == 'Int8'
+
+def test_clean_data_cache(sample_data):
+    """Verify cache hits return the same frame, raw changes miss, and LRU eviction honours the budget."""
+    logger = stats_analysis.setup_environment()
+    sample_data.loc[[2, 4, 5], 'CGPA'] = np.nan  # Mean-filled (10.4 / 3): the export must keep full precision
+    sample_data.to_csv("data/raw.csv", index=False)
+
+    first = clean_cache.load_clean_data("data/raw.csv", logger)
+    second = clean_cache.load_clean_data("data/raw.csv", logger)
+    pd.testing.assert_frame_equal(first, second)
+    assert len(os.listdir(clean_cache.CACHE_DIR)) == 1
+    with open("data/clean_data.csv") as f:
+        exported = f.read()
+
+    # Raw A -> raw B -> raw A: the cache hit must restore A's export, not keep B's rows
+    changed = sample_data.copy()
+    changed.loc[0, 'CGPA'] = 3.9
+    changed.to_csv("data/raw.csv", index=False)
+    clean_cache.load_clean_data("data/raw.csv", logger)
+    with open("data/clean_data.csv") as f:
+        assert f.read() != exported
+    sample_data.to_csv("data/raw.csv", index=False)
+    clean_cache.load_clean_data("data/raw.csv", logger)
+    with open("data/clean_data.csv") as f:
+        assert f.read() == exported  # Byte for byte, as written by the cold run
+    assert clean_cache.written_key("data/clean_data.csv") == clean_cache.cache_key("data/raw.csv")
+
+    # Different raw content -> new entry; a zero budget keeps only the newest one
+    changed.loc[0, 'CGPA'] = 3.8
+    changed.to_csv("data/raw.csv", index=False)
+    clean_cache.load_clean_data("data/raw.csv", logger, max_cache_bytes=0)
+    entries = os.listdir(clean_cache.CACHE_DIR)
+    key = clean_cache.cache_key("data/raw.csv")
+    assert entries == [f"{key}.{clean_cache.CACHE_FORMAT}"]
+
+def test_stages_read_the_exported_clean_data(sample_data):
+    """Stages read what the clean step exported, even after its cache entry is evicted, without re-cleaning."""
+    logger = stats_analysis.setup_environment()
+    sample_data.to_csv("data/raw.csv", index=False)
+    columns = ['Course', 'Is_STEM', 'Stress_Level', 'CGPA']
+    expected = clean_cache.load_clean_data("data/raw.csv", logger, columns=columns)
+
+    pd.testing.assert_frame_equal(clean_cache.load_exported("data/clean_data.csv", columns), expected)
+    for name in os.listdir(clean_cache.CACHE_DIR):
+        os.remove(os.path.join(clean_cache.CACHE_DIR, name))
+    pd.testing.assert_frame_equal(clean_cache.load_exported("data/clean_data.csv", columns), expected,
+                                  check_categorical=False)
+    assert os.listdir(clean_cache.CACHE_DIR) == []  # Nothing was cleaned or cached again
+    assert not [name for name in os.listdir("data") if name.endswith(".tmp")]
+
+def test_storage_round_trip_and_projection(sample_data):
+    """Verify every registered format round-trips the cleaned frame and honours column projection."""
+    df_clean = data_cleaning.pre_process(sample_data).reset_index(drop=True)
+    extensions = ['csv', 'pkl'] + (['feather', 'parquet'] if storage.HAS_ARROW else [])
+
+    for ext in extensions:
+        path = f"data/clean_data.{ext}"
+        storage.write_table(df_clean, path)
+        # CSV carries no dtypes: the schema is re-applied at read time
+        loaded = storage.read_table(path)
+        loaded = data_cleaning.apply_schema(loaded) if ext == 'csv' else loaded
+        pd.testing.assert_frame_equal(loaded, df_clean)
+
+        subset = storage.read_table(path, columns=['Course', 'Stress_Level'])
+        assert list(subset.columns) == ['Course', 'Stress_Level']
+
+def test_mapped_table_takes_rows(sample_data):
+    """Verify a memory-mapped table hands out only the requested rows and columns."""
+    df_clean = data_cleaning.pre_process(sample_data).reset_index(drop=True)
+    extensions = ['pkl'] + (['feather'] if storage.HAS_ARROW else [])
+
+    for ext in extensions:
+        path = f"data/shared.{ext}"
+        storage.write_mapped(df_clean, path)
+        table = storage.open_mapped(path)
+        assert not isinstance(table, pd.DataFrame) or ext == 'pkl'
+
+        rows = [4, 1, 3]
+        pd.testing.assert_frame_equal(storage.take_rows(table, rows), df_clean.take(rows).reset_index(drop=True))
+        subset = storage.take_rows(table, rows, columns=['Course', 'Stress_Level'])
+        assert list(subset.columns) == ['Course', 'Stress_Level']
+
 # --- Stage 2: Supervised Analysis (T-Test) ---
 
 def test_t_test_outputs(sample_data):
@@ -90,6 +263,93 @@ def test_t_test_outputs(sample_data):
     assert 'Significant' in results_df.columns
     assert 'Cohen_d' in results_df.columns
 
+def test_batched_group_comparison(sample_data):
+    """Verify the batched t-test/Cohen's d matches scipy and the per-pair helper for every metric."""
+    from scipy import stats
+    df_clean = data_cleaning.pre_process(sample_data)
+    metrics = ['Stress_Level', 'Depression_Score', 'Anxiety_Score']
+
+    comparison = stats_analysis.compare_groups(df_clean, metrics)
+    for var in metrics:
+        stem, non_stem = df_clean.loc[df_clean['Is_STEM'] == 1, var], df_clean.loc[df_clean['Is_STEM'] == 0, var]
+        t_stat, p_val = stats.ttest_ind(stem, non_stem)
+        assert np.isclose(comparison.loc[var, 'T-Statistic'], t_stat)
+        assert np.isclose(comparison.loc[var, 'P-Value'], p_val)
+        assert np.isclose(comparison.loc[var, 'Cohen_d'], stats_analysis.calculate_cohen_d(stem, non_stem))
+
+def test_resampling_reproducible_and_consistent(sample_data):
+    """Verify seeded resampling is reproducible across worker counts and brackets the point estimate."""
+    rng = np.random.default_rng(0)
+    group1, group2 = rng.integers(0, 6, 400), rng.integers(1, 6, 300)
+    d_val = stats_analysis.calculate_cohen_d(group1, group2)
+
+    serial = resampling.bootstrap_cohen_d(group1, group2, n_resamples=2000, seed=7)
+    parallel = resampling.bootstrap_cohen_d(group1, group2, n_resamples=2000, seed=7, max_workers=2)
+    assert serial == parallel
+    assert serial[0] < d_val < serial[1]
+
+    p_val = resampling.permutation_p_value(group1, group2, n_resamples=2000, seed=7)
+    assert 0 < p_val <= 1
+    assert resampling.permutation_p_value(group1, group1, n_resamples=500, seed=7) == 1.0
+
+    logger = stats_analysis.setup_environment()
+    df_clean = data_cleaning.pre_process(sample_data)
+    stats_analysis.run_t_tests(df_clean, ['Stress_Level'], logger, n_resamples=500, seed=1)
+    assert 'Cohen_d_CI_Low' in pd.read_csv("reports/tables/t_test_results.csv").columns
+
+def test_t_test_resampling_with_empty_group(sample_data):
+    """A cohort without Non-STEM students gets empty resampling columns instead of a crash."""
+    logger = stats_analysis.setup_environment()
+    df_clean = data_cleaning.pre_process(sample_data)
+    stem_only = df_clean[df_clean['Is_STEM'] == 1]
+    stats_analysis.run_t_tests(stem_only, ['Stress_Level'], logger, n_resamples=100, seed=1)
+
+    row = pd.read_csv("reports/tables/t_test_results.csv").iloc[0]
+    assert row[['Cohen_d_CI_Low', 'Cohen_d_CI_High', 'Permutation_P']].isna().all()
+
+def test_anova_from_group_moments(sample_data):
+    """Verify the moment-based ANOVA reproduces scipy's f_oneway."""
+    from scipy import stats
+    df_clean = data_cleaning.pre_process(sample_data)
+    metrics = ['Stress_Level', 'Depression_Score', 'Anxiety_Score']
+
+    anova = stats_analysis.one_way_anova(stats_analysis.group_moments(df_clean, 'Course', metrics))
+    for var in metrics:
+        f_stat, p_val = stats.f_oneway(*[g[var] for _, g in df_clean.groupby('Course', observed=True)])
+        assert np.isclose(anova.loc[var, 'F-Statistic'], f_stat)
+        assert np.isclose(anova.loc[var, 'P-Value'], p_val)
+
+def test_stratified_runner_layout(sample_data):
+    """Verify every stratum gets its own output folder and is listed in the summary."""
+    logger = stats_analysis.setup_environment()
+    sample_data['Gender'] = ['Male', 'Female', 'Male', 'Female', 'Male', 'Female']
+    df_clean = data_cleaning.pre_process(sample_data)
+
+    summary = stratified.run_stratified_analysis(df_clean, 'Gender', logger, max_workers=2, min_rows=2)
+
+    assert set(summary['Gender']) == set(df_clean['Gender'])
+    for output_dir in summary['Output']:
+        assert os.path.exists(os.path.join(output_dir, "risk_prediction_report.txt"))
+        assert os.path.exists(os.path.join(output_dir, "Stress_Level_comparison.png"))
+    assert os.path.exists(os.path.join(stratified.STRATA_DIR, "strata_summary.csv"))
+
+def test_native_tukey_matches_statsmodels():
+    """Verify the moment-based Tukey HSD reproduces statsmodels' pairwise_tukeyhsd."""
+    from statsmodels.stats.multicomp import pairwise_tukeyhsd
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame({'Course': rng.choice(['Law', 'Medical', 'Business', 'Engineering'], 300),
+                       'Stress_Level': rng.integers(0, 6, 300)})
+    df.loc[df['Course'] == 'Medical', 'Stress_Level'] += 1
+
+    native = stats_analysis.tukey_hsd(stats_analysis.group_moments(df, 'Course', ['Stress_Level']), 'Stress_Level')
+    reference = pairwise_tukeyhsd(df['Stress_Level'], df['Course']).summary_frame()
+
+    assert list(native['group1']) == list(reference['group_c'])
+    assert list(native['group2']) == list(reference['group_t'])
+    for native_col, reference_col in [('meandiff', 'meandiff'), ('p-adj', 'p-adj'), ('lower', 'lower'), ('upper', 'upper')]:
+        assert np.allclose(native[native_col], reference[reference_col])
+    assert list(native['reject']) == list(reference['reject'])
+
 # --- Stage 3: Modeling (EFA) ---
 
 def test_efa_outputs(sample_data):
@@ -101,6 +361,53 @@ def test_efa_outputs(sample_data):
     file_path = "reports/tables/efa_assumptions.csv"
     assert os.path.exists(file_path)
 
+def test_efa_engine_matches_factor_analyzer():
+    """KMO/Bartlett from the streamed correlation matrix match factor_analyzer; the scan covers every cohort."""
+    from factor_analyzer.factor_analyzer import calculate_bartlett_sphericity, calculate_kmo
+    df = data_cleaning.pre_process(synthetic.generate_survey(3000, seed=2), output_path=None)
+    items = efa_engine.ITEM_SPACE[:6]
+
+    # Chunked accumulation gives the same matrix as a single pass
+    corr, n = efa_engine.correlation_matrix(df, items, chunk_rows=700)
+    assert n == len(df) and np.allclose(corr, df[items].corr())
+    assert np.isclose(efa_engine.kmo(corr)[1], calculate_kmo(df[items])[1])
+    assert np.allclose(efa_engine.bartlett_sphericity(corr, n), calculate_bartlett_sphericity(df[items]))
+
+    # A one-factor structure is recovered from its correlation matrix
+    loadings = np.array([[0.8], [0.7], [0.6], [0.5]])
+    model = loadings @ loadings.T
+    np.fill_diagonal(model, 1)
+    assert np.allclose(efa_engine.extract_factors(model, 1), loadings, atol=1e-3)
+
+    logger = stats_analysis.setup_environment()
+    scan = efa_engine.scan_efa(df, logger, efa_engine.candidate_sets(items, 3, 5), (1, 2), 'Course', max_workers=2)
+    assert set(scan['Course']) == set(df['Course']) | {efa_engine.ALL_ROWS}
+    assert (scan['Status'] == "ok").all() and scan['N_Factors'].max() == 2
+    assert os.path.exists(efa_engine.SCAN_PATH)
+
+def test_streaming_correlation_matches_pandas():
+    """Chunked, merged co-moments reproduce DataFrame.corr/cov (pairwise) and Spearman on complete rows."""
+    columns = ['Age', 'CGPA', 'Stress_Level', 'Depression_Score', 'Financial_Stress']
+    df = synthetic.generate_survey(4000, missing_rates=0.05, seed=5)[columns].astype(float)
+
+    acc = correlation.accumulate(df, columns, chunk_rows=333)
+    pd.testing.assert_frame_equal(correlation.correlation(acc), df.corr(), atol=1e-10)
+    pd.testing.assert_frame_equal(correlation.covariance(acc), df.cov(), atol=1e-10)
+
+    # Partial results over disjoint rows merge into the full result
+    halves = [correlation.accumulate(df.iloc[:1500], columns), correlation.accumulate(df.iloc[1500:], columns)]
+    merged = correlation.merge_comoments(*halves)
+    assert np.allclose(merged['comoment'], acc['comoment']) and np.array_equal(merged['n'], acc['n'])
+
+    complete = df.dropna()
+    spearman = correlation.accumulate_parallel([complete.iloc[:2000], complete.iloc[2000:]], columns, 'spearman',
+                                               max_workers=2)
+    pd.testing.assert_frame_equal(correlation.correlation(spearman), complete.corr('spearman'), atol=1e-10)
+
+    correlation.save_comoments(acc, "data/cache/comoments.npz")
+    loaded = correlation.load_comoments("data/cache/comoments.npz")
+    assert loaded['variables'] == columns and correlation.observations(loaded) == correlation.observations(acc)
+
 # --- Stage 4: Visualization & Files ---
 
 def test_visualization_files(sample_data):
@@ -139,6 +446,36 @@ def test_correlation_heatmap_generation(sample_data):
     file_path = "reports/figures/correlation_heatmap.png"
     assert os.path.exists(file_path), "The correlation heatmap file was not generated."
 
+def test_parallel_chart_rendering(sample_data):
+    """Checks the precomputed mean/SE summary and that pooled rendering writes every chart."""
+    df_clean = data_cleaning.pre_process(sample_data)
+    metrics = ['Stress_Level', 'Depression_Score', 'Anxiety_Score']
+    summary = visualization.course_summary(df_clean, metrics)
+
+    grouped = df_clean.groupby('Course', observed=True)['Stress_Level']
+    assert np.allclose(summary[('Stress_Level', 'mean')], grouped.mean())
+    assert np.allclose(summary[('Stress_Level', 'sem')].fillna(0), grouped.sem().fillna(0))
+
+    tasks = [visualization.bar_chart_task(summary, var, var, output_dir="reports/figures/batch") for var in metrics]
+    paths = visualization.render_charts(tasks, max_workers=2)
+    assert all(os.path.getsize(path) > 0 for path in paths) and len(paths) == 3
+
+def test_significance_markers_from_tukey():
+    """Markers and titles follow the Tukey table: a group is starred when it differs from all others."""
+    groups = ['Law', 'Medical', 'Business', 'Engineering']
+    sig_pairs = pd.DataFrame({
+        'group1': ['Business', 'Engineering', 'Law', 'Business'],
+        'group2': ['Law', 'Law', 'Medical', 'Medical'],
+        'reject': [True, True, True, True]
+    })
+    markers = visualization.significance_markers(sig_pairs, groups)
+    assert markers == {'Law': '*'}
+    assert visualization.chart_title('Anxiety_Score', markers) == "Anxiety Scores Across Courses (Law Group Significance)"
+    assert visualization.significance_markers(None, groups) == {}
+    assert visualization.chart_title('Stress_Level', {}) == "Stress Levels Across Courses"
+    assert visualization.chart_title('Financial_Stress', {}) == "Financial Stress Across Courses"
+    assert visualization.chart_title('CGPA', {}) == "CGPA Across Courses"
+
 # --- Stage 5: Structural Requirements ---
 
 def test_environment_setup():
@@ -186,4 +523,289 @@ def test_risk_calculation_accuracy(sample_data):
     # Verify that the calculated value is correctly written in the report
     with open("reports/tables/risk_prediction_report.txt", "r") as f:
         report_content = f.read()
-        assert expected_str in report_content, f"Math error: Expected {expected_str} not found."
\ No newline at end of file
+        assert expected_str in report_content, f"Math error: Expected {expected_str} not found."
+
+def test_risk_model_fit_and_batch_scoring(sample_data):
+    """
+    Verifies the trained model round-trips through its JSON artifact and
+    scores raw survey rows exactly like their cleaned counterparts.
+    """
+    logger = stats_analysis.setup_environment()
+    df_clean = data_cleaning.pre_process(sample_data)
+    model = predictive_modeling.fit_risk_model(df_clean, logger, model_path="data/risk_model.json")
+
+    loaded = predictive_modeling.load_risk_model("data/risk_model.json")
+    scores = predictive_modeling.predict_proba(loaded, df_clean)
+    assert scores.shape == (len(df_clean), len(predictive_modeling.RISK_TARGETS))
+    assert ((scores > 0) & (scores < 1)).all().all()
+
+    raw_scores = predictive_modeling.predict_proba(model, sample_data.loc[df_clean.index])
+    assert np.allclose(raw_scores.to_numpy(), scores.to_numpy())
+
+def test_risk_model_with_missing_ordinal():
+    """Unknown ordinal labels (encoded as NaN) are imputed with the training means instead of failing the fit."""
+    logger = stats_analysis.setup_environment()
+    survey = synthetic.generate_survey(400, seed=3)
+    survey['Sleep_Quality'] = survey['Sleep_Quality'].astype(object)
+    survey.loc[:4, 'Sleep_Quality'] = 'Unknown'
+    df_clean = data_cleaning.pre_process(survey, output_path=None)
+    assert df_clean['Sleep_Quality'].isna().any()
+
+    model = predictive_modeling.fit_risk_model(df_clean, logger, model_path="data/risk_model.json")
+    assert np.isfinite(model['weights']).all() and np.isfinite(model['intercepts']).all()
+    assert predictive_modeling.load_risk_model("data/risk_model.json") == model
+    assert predictive_modeling.predict_proba(model, df_clean).notna().all().all()
+
+def test_risk_table_single_pass(sample_data):
+    """Verifies the one-groupby risk table matches a per-target manual calculation."""
+    df_clean = data_cleaning.pre_process(sample_data)
+    table = predictive_modeling.compute_risk_table(df_clean)
+
+    for col in predictive_modeling.RISK_TARGETS:
+        expected = (df_clean[col] > 3).groupby(df_clean['Course'], observed=True).mean() * 100
+        assert np.allclose(table[(col, 'rate')].loc[expected.index], expected)
+        assert (table[(col, 'count')] == df_clean.groupby('Course', observed=True).size()).all()
+
+def test_incremental_waves_match_full_run(sample_data):
+    """Ensures folding appended waves into the saved state reproduces the full-run reports."""
+    import logging
+    logger = logging.getLogger("test")
+    metrics = ['Stress_Level', 'Depression_Score', 'Anxiety_Score']
+
+    # Wave 1, then wave 2 appended to the same raw file
+    sample_data.iloc[:4].to_csv("data/raw.csv", index=False)
+    incremental.update_incremental_state("data/raw.csv", logger)
+    sample_data.iloc[4:].to_csv("data/raw.csv", mode="a", header=False, index=False)
+    state = incremental.update_incremental_state("data/raw.csv", logger)
+    assert state['cells']['rows'].sum() == len(sample_data)
+
+    # The full run's t-test table (with resampling columns) must survive the incremental reports
+    df_clean = data_cleaning.pre_process(sample_data, output_path=None)
+    stats_analysis.run_t_tests(df_clean, metrics, logger, n_resamples=50, seed=0)
+    full_t_tests = open("reports/tables/t_test_results.csv").read()
+    predictive_modeling.run_risk_prediction_pipeline(df_clean, logger)
+    full_risk = open("reports/tables/risk_prediction_report.txt").read()
+
+    incremental.run_incremental_reports(state, logger, heatmap=False)
+    assert open("reports/tables/t_test_results.csv").read() == full_t_tests
+    assert open("reports/tables/risk_prediction_report.txt").read() == full_risk
+    moment_columns = pd.read_csv("reports/tables/t_test_results.csv").columns[:5]
+    pd.testing.assert_frame_equal(pd.read_csv(f"reports/tables/{incremental.T_TEST_FILE}"),
+                                  pd.read_csv("reports/tables/t_test_results.csv")[moment_columns])
+
+    corr = incremental.state_correlation(incremental.clean_cells(state), metrics)
+    assert np.allclose(corr, df_clean[metrics].corr())
+
+def _write_upper(logger, source, target):
+    """Toy DAG stage: copies source to target in upper case."""
+    with open(source) as f, open(target, "w") as out:
+        out.write(f.read().upper())
+
+def test_stage_dag_order_and_skip_if_fresh():
+    """Checks dependency ordering, skip-if-fresh fingerprints and cycle detection of the stage DAG."""
+    import logging
+    logger = logging.getLogger("test")
+    with open("data/a.txt", "w") as f:
+        f.write("wave one")
+    stages = [
+        pipeline_dag.stage("second", _write_upper, inputs=["data/b.txt"], outputs=["data/c.txt"],
+                           params={'source': "data/b.txt", 'target': "data/c.txt"}),
+        pipeline_dag.stage("first", _write_upper, inputs=["data/a.txt"], outputs=["data/b.txt"],
+                           params={'source': "data/a.txt", 'target': "data/b.txt"}),
+    ]
+    assert pipeline_dag.stage_dependencies(stages) == {'second': {'first'}, 'first': set()}
+
+    summary = pipeline_dag.run_stages(stages, logger, max_workers=1)
+    assert list(summary['Status']) == ["ok", "ok"]
+    assert open("data/c.txt").read() == "WAVE ONE"
+
+    # Unchanged inputs are skipped; a changed input re-runs its stage and everything downstream
+    assert set(pipeline_dag.run_stages(stages, logger, max_workers=1)['Status']) == {"skipped"}
+    with open("data/a.txt", "w") as f:
+        f.write("wave two")
+    assert list(pipeline_dag.run_stages(stages, logger, max_workers=1)['Status']) == ["ok", "ok"]
+    assert open("data/c.txt").read() == "WAVE TWO"
+
+    # An output rewritten outside the DAG makes its stage stale, even though the file still exists
+    with open("data/c.txt", "w") as f:
+        f.write("edited elsewhere")
+    assert list(pipeline_dag.run_stages(stages, logger, max_workers=1)['Status']) == ["ok", "skipped"]
+    assert open("data/c.txt").read() == "WAVE TWO"
+
+    # Fingerprints cover every SRC module a stage's code imports, e.g. the Tukey logic behind the bar charts
+    closure = pipeline_dag.code_closure(['SRC.visualization'])
+    assert {'SRC.stats_analysis', 'SRC.analysis_context', 'SRC.report_sink', 'SRC.resampling'} <= set(closure)
+
+    cyclic = stages + [pipeline_dag.stage("loop", _write_upper, inputs=["data/c.txt"], outputs=["data/a.txt"])]
+    with pytest.raises(ValueError):
+        pipeline_dag.stage_dependencies(cyclic)
+
+def test_cli_lazy_imports():
+    """Ensures importing the CLI does not load the plotting/EFA/scipy stacks and subcommands select their stages."""
+    import subprocess
+    import sys
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    check = ("import sys, main; "
+             "print(sorted(m for m in ('seaborn', 'matplotlib', 'scipy.stats', 'factor_analyzer', 'sklearn') "
+             "if m in sys.modules))")
+    output = subprocess.run([sys.executable, "-c", check], cwd=repo_root, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == "[]"
+
+    import main
+    names = [s['name'] for s in main.select_stages(main.pipeline_stages(), 'risk')]
+    assert names == ['clean', 'risk_report', 'risk_model']
+    assert main.build_parser().parse_args([]).command == 'all'
+    args = main.build_parser().parse_args(['clean', '--stream', '--chunksize', '500'])
+    clean_stage = main.pipeline_stages(stream=args.stream, chunksize=args.chunksize)[0]
+    assert clean_stage['params'] == {'stream': True, 'chunksize': 500}
+
+def test_report_sink_background_writes(sample_data):
+    """Queued reports land atomically at flush(), can be bundled, and write errors surface at flush()."""
+    import zipfile
+    logger = stats_analysis.setup_environment()
+    df_clean = data_cleaning.pre_process(sample_data)
+    report_sink.configure(async_writes=True)
+    try:
+        stats_analysis.run_t_tests(df_clean, ['Stress_Level'], logger)
+        predictive_modeling.run_risk_prediction_pipeline(df_clean, logger)
+        report_sink.write_bundle("reports/bundles/run.zip")
+        report_sink.flush()
+
+        assert os.path.exists("reports/tables/t_test_results.csv")
+        assert os.path.exists("reports/tables/risk_prediction_report.txt")
+        with zipfile.ZipFile("reports/bundles/run.zip") as bundle:
+            assert {"reports/tables/t_test_results.csv", "reports/tables/risk_prediction_report.txt"} <= set(bundle.namelist())
+        assert not [name for name in os.listdir("reports/tables") if name.endswith(".tmp")]
+
+        report_sink.submit("reports/tables/broken.csv", lambda tmp_path: 1 / 0)
+        with pytest.raises(OSError):
+            report_sink.flush()
+        assert not os.path.exists("reports/tables/broken.csv")
+    finally:
+        report_sink.configure()
+
+    # Concurrent writers of one report each use their own temporary file; the last rename wins
+    from concurrent.futures import ThreadPoolExecutor
+    def slow_write(text):
+        import time
+        def write(tmp_path):
+            with open(tmp_path, "w") as f:
+                f.write(text)
+            time.sleep(0.05)
+        return report_sink.submit("reports/tables/shared.txt", write)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(slow_write, ["a", "b", "c", "d"]))
+    assert open("reports/tables/shared.txt").read() in "abcd"
+    assert not [name for name in os.listdir("reports/tables") if name.endswith(".tmp")]
+
+def test_synthetic_survey_schema():
+    """The generator follows the st_1.csv schema, honours the course count and missingness, and feeds pre_process."""
+    df = synthetic.generate_survey(5000, n_courses=9, missing_rates=0.1, seed=1)
+    assert list(df.columns) == synthetic.SURVEY_COLUMNS
+    assert df['Course'].nunique() == 9
+    assert 0.05 < df['CGPA'].isna().mean() < 0.15
+    assert df['Stress_Level'].between(0, 5).all()
+
+    df_clean = data_cleaning.pre_process(df, output_path=None)
+    assert df_clean['Substance_Use'].notna().all() and len(df_clean) > 0
+
+    synthetic.write_survey("data/synthetic.csv", 2500, chunk_rows=1000, seed=1)
+    assert len(pd.read_csv("data/synthetic.csv")) == 2500
+
+def test_benchmark_flags_regressions():
+    """A stage slower or larger than its stored baseline beyond the tolerance is flagged."""
+    stages = ['pre_process', 'calculate_target_risk']
+    results = benchmark.run_benchmarks([2000], stages, baseline_path="data/none.json")
+    assert list(results['Stage']) == stages and (results['Status'] == "ok").all()
+    assert not results['Regression'].any()
+
+    benchmark.save_baseline(results.assign(Seconds=1e-6, Peak_MB=1e-6), "data/baseline.json")
+    flagged = benchmark.compare_to_baseline(results.drop(columns=['Regression']), benchmark.load_baseline("data/baseline.json"))
+    assert flagged['Regression'].all()
+
+def test_stage_instrumentation_records(sample_data):
+    """Instrumented stages append one JSON metrics line each; profiling adds a cProfile dump."""
+    logger = stats_analysis.setup_environment()
+    instrumentation.configure(profile=True, trace_memory=True)
+    try:
+        df_clean = data_cleaning.pre_process(sample_data)
+        stats_analysis.run_t_tests(df_clean, ['Stress_Level'], logger)
+    finally:
+        instrumentation.configure()
+
+    metrics = instrumentation.read_metrics()
+    assert list(metrics['stage']) == ['data_cleaning.pre_process', 'stats_analysis.run_t_tests']
+    first = metrics.iloc[0]
+    assert first['input_rows'] == len(sample_data) and first['output']['rows'] == len(df_clean)
+    assert (metrics['wall_s'] >= 0).all() and metrics['tracemalloc_peak_mb'].notna().all()
+    assert all(os.path.exists(path) for path in metrics['profile'])
+    assert os.path.dirname(instrumentation.METRICS_PATH) == "logs"
+
+def test_analysis_context_shares_aggregates(sample_data):
+    """Stages given one context compute the group moments once, with the same reports; a new frame invalidates them."""
+    logger = stats_analysis.setup_environment()
+    metrics = ['Stress_Level', 'Depression_Score', 'Anxiety_Score']
+    df_clean = data_cleaning.pre_process(sample_data)
+    expected = stats_analysis.run_anova_and_tukey(df_clean, metrics, logger)
+
+    context = analysis_context.new_context(df_clean)
+    stats_analysis.run_t_tests(df_clean, metrics, logger, n_resamples=50, seed=0, context=context)
+    tukey = stats_analysis.run_anova_and_tukey(df_clean, metrics, logger, context=context)
+    summary = visualization.course_summary(df_clean, metrics, context=context)
+    assert context['hits'] >= 1 and context['misses'] == 4  # STEM moments + split, Course moments + Tukey
+    assert expected.keys() == tukey.keys()
+    assert all(expected[var].equals(tukey[var]) for var in tukey)
+    grouped = df_clean.groupby('Course', observed=True)['Stress_Level']
+    assert np.allclose(summary[('Stress_Level', 'sem')].fillna(0), grouped.sem().fillna(0))
+
+    table = predictive_modeling.shared_risk_table(df_clean, context=context)
+    assert predictive_modeling.shared_risk_table(df_clean, context=context) is table
+    analysis_context.invalidate(context, df_clean.iloc[:50])
+    assert context['cache'] == {}
+    assert predictive_modeling.shared_risk_table(context['df'], context=context) is not table
+    # A frame other than the context's is never served from the memo
+    assert stats_analysis.shared_moments(df_clean, 'Course', metrics, context)['count'].to_numpy().sum() == 3 * len(df_clean)
+
+def test_stage_context_keyed_on_clean_export(sample_data, monkeypatch):
+    """Stages share one context per clean export without hashing the raw file; a new export replaces it."""
+    import main
+    logger = stats_analysis.setup_environment()
+    sample_data.to_csv(main.RAW_PATH, index=False)
+    main.stage_clean(logger)
+    main._CONTEXTS.clear()
+
+    def no_raw_hashing(path, block_size=1 << 20):
+        raise AssertionError(f"{path} was hashed")
+    with monkeypatch.context() as patched:
+        patched.setattr(clean_cache, "file_digest", no_raw_hashing)
+        context = main.load_context(logger)
+        assert main.load_context(logger) is context
+        assert len(context['df']) == len(pd.read_csv(main.CLEAN_PATH))
+
+    sample_data.loc[0, 'CGPA'] = 3.9
+    sample_data.to_csv(main.RAW_PATH, index=False)
+    main.stage_clean(logger)
+    assert main.load_context(logger) is not context
+    main._CONTEXTS.clear()
+
+def test_efa_stage_uses_listwise_rows(sample_data):
+    """The EFA stage's KMO/Bartlett rest on the same (listwise) rows as an in-memory run."""
+    import main
+    logger = stats_analysis.setup_environment()
+    metrics = main.METRICS
+    rng = np.random.default_rng(5)
+    df_clean = data_cleaning.pre_process(pd.concat([sample_data] * 10, ignore_index=True))
+    df_clean[metrics] = rng.integers(0, 6, (len(df_clean), len(metrics)))
+    df_clean[metrics] = df_clean[metrics].astype(float)
+    df_clean.loc[df_clean.index[[0, 7]], 'Stress_Level'] = np.nan  # Pairwise and listwise rows differ
+    df_clean.to_csv(main.CLEAN_PATH, index=False)
+
+    main.stage_correlation(logger, main.CORRELATION_COLUMNS, metrics)
+    main.stage_efa(logger, metrics)
+    report_sink.flush()
+    staged = pd.read_csv("reports/tables/efa_assumptions.csv")
+
+    unsupervised.run_unsupervised_analysis(df_clean, metrics, logger)
+    report_sink.flush()
+    pd.testing.assert_frame_equal(staged, pd.read_csv("reports/tables/efa_assumptions.csv"))
+    assert correlation.observations(correlation.load_comoments(main.EFA_COMOMENTS_PATH)) == len(df_clean) - 2